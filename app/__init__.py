@@ -1,28 +1,45 @@
 import os
 
-from flask import Flask, jsonify
-from flask_bcrypt import Bcrypt
+from flask import Flask, Response
 from flask_migrate import Migrate
 from flask_restful import Api
 from flask_sqlalchemy import SQLAlchemy
-from flask_swagger import swagger
 from flask_swagger_ui import get_swaggerui_blueprint
 
 from .config import Config
 
 db = SQLAlchemy()
 api = Api()
-bcrypt = Bcrypt()
 migrate = Migrate()
 
 
 def create_app(conf=Config):
     app = Flask(__name__)
+    # Defaults first, so partial configs (e.g. in tests) only override what they define
+    app.config.from_object(Config)
     app.config.from_object(conf)
+    if "SQLALCHEMY_ENGINE_OPTIONS" not in app.config:
+        from .pool import engine_options
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config)
+    if app.config["SQLALCHEMY_REPLICA_URIS"]:
+        from .replicas import replica_binds
+        app.config["SQLALCHEMY_BINDS"] = {**replica_binds(app.config), **app.config.get("SQLALCHEMY_BINDS", {})}
 
     db.init_app(app)
-    bcrypt.init_app(app)
-    migrate.init_app(app, db)
+    migrate.init_app(app, db, render_as_batch=True)
+
+    from . import search  # noqa: registers the full-text index DDL
+    from .cache import reference_cache, principal_cache
+    reference_cache.init_app(app)
+    principal_cache.init_app(app)
+    from .hashing import password_hasher
+    password_hasher.init_app(app)
+    from .ratelimit import limiter
+    limiter.init_app(app)
+    from .replicas import replicas
+    replicas.init_app(app)
+    from .compression import compressor
+    compressor.init_app(app)
 
     from .resources import initialize_resources
     api = Api(app)
@@ -30,16 +47,26 @@ def create_app(conf=Config):
 
     swagger_init(app)
 
+    from . import metrics
+    metrics.init_app(app)
+
     return app
 
 
 def swagger_init(app):
     @app.route("/spec")
     def spec():
-        swag = swagger(app)
-        swag['info']['version'] = "1.0"
-        swag['info']['title'] = "My API"
-        return jsonify(swag)
+        from .spec import get_spec
+        from .utils import not_modified
+
+        body, etag = get_spec()
+        response = not_modified(etag)
+        if response is None:
+            response = Response(body, mimetype="application/json")
+            response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = app.config["SWAGGER_SPEC_MAX_AGE"]
+        return response
 
     swagger_ui_blueprint = get_swaggerui_blueprint(
         os.getenv("SWAGGER_URL"),
@@ -0,0 +1,243 @@
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session, selectinload
+
+from . import db
+from .models import Status, Group, Role, User
+
+
+class ReferenceCache:
+    """
+    Name -> row cache of the small, nearly static lookup tables (Status, Group, Role).
+
+    Rows of a table are loaded once per app in a private session and handed out merged
+    into the request session with merge(load=False), which emits no SQL. A committed
+    insert, update or delete on a table drops that table from the cache. Rows written
+    elsewhere (other workers, scripts) show up after REFERENCE_CACHE_TTL seconds, or at
+    once when a name is missing, at most every REFERENCE_CACHE_MISS_RELOAD seconds.
+    """
+    models = (Status, Group, Role)
+
+    def init_app(self, app):
+        app.extensions["reference_cache"] = {}
+
+    def _rows(self, model, names=()):
+        tables = current_app.extensions["reference_cache"]
+        config = current_app.config
+        rows, loaded = tables.get(model, (None, 0))
+        if rows is not None:
+            age = time.monotonic() - loaded
+            if age > config["REFERENCE_CACHE_TTL"] or (
+                    age > config["REFERENCE_CACHE_MISS_RELOAD"]
+                    and any(isinstance(name, str) and name not in rows for name in names)):
+                rows = None
+        if rows is None:
+            loaded = time.monotonic()
+            # Closing the session detaches the rows but keeps their loaded attributes
+            with Session(db.engine) as session:
+                rows = {obj.name: obj for obj in session.scalars(select(model))}
+            tables[model] = (rows, loaded)
+        return rows
+
+    def get(self, model, name):
+        if not isinstance(name, str):
+            return None
+        obj = self._rows(model, (name,)).get(name)
+        if obj is None:
+            return None
+        return db.session.merge(obj, load=False)
+
+    def ids(self, model, names=()):
+        """name -> id of every row (reloaded if one of `names` is missing), for set based validation"""
+        return {name: obj.id for name, obj in self._rows(model, names).items()}
+
+    def get_many(self, model, names):
+        """Rows for the known names, unknown and repeated ones are skipped"""
+        names = dict.fromkeys(name for name in names if isinstance(name, str))
+        self._rows(model, names)
+        return [obj for obj in (self.get(model, name) for name in names) if obj is not None]
+
+    def invalidate(self, *models):
+        tables = current_app.extensions["reference_cache"]
+        for model in models or self.models:
+            tables.pop(model, None)
+
+
+ADMIN_ROLE = 'Admin'
+
+
+class Principal:
+    """What authorization needs to know about a user, detached from any session.
+
+    Role names and group ids are frozen once per user load, so every check is a set lookup.
+    """
+    __slots__ = ("id", "roles", "group_ids", "is_admin")
+
+    def __init__(self, id, roles, group_ids):
+        self.id = id
+        self.roles = frozenset(roles)
+        self.group_ids = frozenset(group_ids)
+        self.is_admin = ADMIN_ROLE in self.roles
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, (r.name for r in user.roles), (g.id for g in user.groups))
+
+    def has_role(self, role):
+        return role in self.roles
+
+    def __repr__(self):
+        return f'<Principal {self.id} {sorted(self.roles)}>'
+
+
+class TTLCache:
+    """Thread safe LRU mapping whose entries also expire after ttl seconds"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, generation=None):
+        """Store value unless an invalidation happened since `generation` was read"""
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, *keys):
+        with self._lock:
+            self.generation += 1
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+
+
+class PrincipalCache:
+    """
+    user id -> Principal, so authenticating a request needs no database work in the common case.
+
+    Entries live PRINCIPAL_CACHE_TTL seconds at most (other workers' changes become visible
+    after that), changes committed by this process drop them immediately.
+    """
+
+    def init_app(self, app):
+        app.extensions["principal_cache"] = TTLCache(
+            app.config["PRINCIPAL_CACHE_SIZE"], app.config["PRINCIPAL_CACHE_TTL"]
+        )
+        app.extensions["authz_version_cache"] = TTLCache(
+            app.config["PRINCIPAL_CACHE_SIZE"], app.config["PRINCIPAL_CACHE_TTL"]
+        )
+
+    def get(self, user_id):
+        cache = current_app.extensions["principal_cache"]
+        principal = cache.get(user_id)
+        if principal is None:
+            generation = cache.generation
+            user = User.query.options(
+                selectinload(User.roles), selectinload(User.groups)
+            ).filter_by(id=user_id).first()
+            if user is None:
+                return None
+            principal = Principal.from_user(user)
+            cache.set(user_id, principal, generation)
+        return principal
+
+    def authz_version(self, user_id):
+        """Current User.authz_version (None for unknown users), checked against token claims"""
+        cache = current_app.extensions["authz_version_cache"]
+        version = cache.get(user_id)
+        if version is None:
+            generation = cache.generation
+            version = db.session.execute(
+                select(User.authz_version).where(User.id == user_id)
+            ).scalar()
+            if version is None:
+                return None
+            cache.set(user_id, version, generation)
+        return version
+
+    def invalidate(self, *user_ids):
+        for name in ("principal_cache", "authz_version_cache"):
+            cache = current_app.extensions[name]
+            if user_ids:
+                cache.pop(*user_ids)
+            else:
+                cache.clear()
+
+
+reference_cache = ReferenceCache()
+principal_cache = PrincipalCache()
+
+
+def _authz_changed(user):
+    attrs = inspect(user).attrs
+    return attrs.roles.history.has_changes() or attrs.groups.history.has_changes()
+
+
+@event.listens_for(db.session, "after_flush")
+def _collect_changes(session, flush_context):
+    changed = {
+        type(obj) for obj in chain(session.new, session.deleted)
+        if isinstance(obj, ReferenceCache.models)
+    }
+    # Backref collections (e.g. Status.tickets) also mark rows dirty, only columns count
+    changed.update(
+        type(obj) for obj in session.dirty
+        if isinstance(obj, ReferenceCache.models) and session.is_modified(obj, include_collections=False)
+    )
+    if changed:
+        session.info.setdefault("reference_changes", set()).update(changed)
+
+    users = {
+        obj.id for obj in chain(session.dirty, session.deleted)
+        if isinstance(obj, User) and (obj in session.deleted or _authz_changed(obj))
+    }
+    if users:
+        session.info.setdefault("principal_changes", set()).update(users)
+
+
+@event.listens_for(db.session, "after_commit")
+def _invalidate_caches(session):
+    changed = session.info.pop("reference_changes", None)
+    users = session.info.pop("principal_changes", None)
+    if not has_app_context():
+        return
+    if changed:
+        reference_cache.invalidate(*changed)
+    if users:
+        principal_cache.invalidate(*users)
+
+
+@event.listens_for(db.session, "after_rollback")
+def _discard_changes(session):
+    session.info.pop("reference_changes", None)
+    session.info.pop("principal_changes", None)
@@ -0,0 +1,150 @@
+import zlib
+
+from flask import current_app, request
+
+from .cache import TTLCache
+
+
+class GzipEncoder:
+    name = "gzip"
+
+    def __init__(self, level):
+        self.level = level
+
+    def _compressobj(self):
+        # wbits 31: gzip container
+        return zlib.compressobj(self.level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        compressor = self._compressobj()
+        return compressor.compress(data) + compressor.flush()
+
+    def stream(self, chunks):
+        compressor = self._compressobj()
+        for chunk in chunks:
+            # Sync flush: every chunk reaches the client as soon as it is produced
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+
+
+class BrotliEncoder:
+    name = "br"
+
+    def __init__(self, level):
+        import brotli  # optional dependency
+
+        self.brotli = brotli
+        self.level = level
+
+    def compress(self, data):
+        return self.brotli.compress(data, quality=self.level)
+
+    def stream(self, chunks):
+        compressor = self.brotli.Compressor(quality=self.level)
+        for chunk in chunks:
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+
+
+class ZstdEncoder:
+    name = "zstd"
+
+    def __init__(self, level):
+        import zstandard  # optional dependency
+
+        self.zstandard = zstandard
+        self.compressor = zstandard.ZstdCompressor(level=level)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def stream(self, chunks):
+        compressor = self.compressor.compressobj()
+        for chunk in chunks:
+            yield compressor.compress(chunk) + compressor.flush(self.zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        yield compressor.flush(self.zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+ENCODERS = {encoder.name: encoder for encoder in (ZstdEncoder, BrotliEncoder, GzipEncoder)}
+
+
+def encoded_etag(etag, encoding):
+    """ETag of the `encoding` compressed variant of a representation (strong ETags differ per encoding)"""
+    return f"{etag}-{encoding}"
+
+
+class Compressor:
+    """
+    Negotiated response compression (Accept-Encoding) of text payloads in an after_request hook.
+
+    Encodings are offered in COMPRESS_ALGORITHMS order, among those whose module is installed
+    (gzip always is). Bodies below COMPRESS_MIN_SIZE stay as they are, streamed responses are
+    compressed chunk by chunk. Variants of responses with a strong ETag are kept in an LRU
+    keyed by URL, ETag and encoding, so unchanged pages are compressed once.
+    """
+
+    def init_app(self, app):
+        config = app.config
+        levels = {
+            "gzip": config["COMPRESS_GZIP_LEVEL"],
+            "br": config["COMPRESS_BROTLI_LEVEL"],
+            "zstd": config["COMPRESS_ZSTD_LEVEL"],
+        }
+        encoders = {}
+        for name in config["COMPRESS_ALGORITHMS"]:
+            if name not in ENCODERS:
+                raise ValueError(f"Unsupported COMPRESS_ALGORITHMS entry: {name}")
+            try:
+                encoders[name] = ENCODERS[name](levels[name])
+            except ImportError:
+                continue
+        app.extensions["compression"] = {
+            "encoders": encoders,
+            "cache": TTLCache(config["COMPRESS_CACHE_SIZE"], config["COMPRESS_CACHE_TTL"]),
+        }
+        if config["COMPRESS_ENABLED"] and encoders:
+            app.after_request(self.after_request)
+
+    @staticmethod
+    def after_request(response):
+        config = current_app.config
+        if (response.mimetype not in config["COMPRESS_MIMETYPES"] or response.direct_passthrough
+                or "Content-Encoding" in response.headers):
+            return response
+        # Caches must keep the representations of different Accept-Encoding headers apart
+        response.vary.add("Accept-Encoding")
+        if response.status_code < 200 or response.status_code in (204, 304):
+            return response
+        state = current_app.extensions["compression"]
+        encoding = request.accept_encodings.best_match(list(state["encoders"]))
+        if encoding is None:
+            return response
+        encoder = state["encoders"][encoding]
+
+        if response.is_streamed:
+            chunks = response.response
+            response.response = encoder.stream(response.iter_encoded())
+            if hasattr(chunks, "close"):
+                # Lets the original generator clean up (e.g. stream_with_context) when the client goes away
+                response.call_on_close(chunks.close)
+            response.headers.pop("Content-Length", None)
+        else:
+            body = response.get_data()
+            if len(body) < config["COMPRESS_MIN_SIZE"]:
+                return response
+            etag, weak = response.get_etag()
+            # ETags are only unique per resource, the URL keeps different resources apart
+            key = (request.full_path, etag, encoding) if etag and not weak else None
+            compressed = state["cache"].get(key) if key else None
+            if compressed is None:
+                compressed = encoder.compress(body)
+                if key:
+                    state["cache"].set(key, compressed)
+            response.set_data(compressed)
+            if key:
+                response.set_etag(encoded_etag(etag, encoding))
+        response.headers["Content-Encoding"] = encoding
+        return response
+
+
+compressor = Compressor()
@@ -1,3 +1,4 @@
+import multiprocessing
 import os
 
 class Config:
@@ -5,5 +6,102 @@ class Config:
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'your_secret_key'
     SQLALCHEMY_DATABASE_URI = os.environ.get('SQLALCHEMY_DATABASE_URI') or 'sqlite:///ticketsystem_rest.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Connection pool per process, size it against SERVER_WORKERS x SERVER_THREADS and the server's max_connections
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 5)
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW') or 10)
+    # Seconds to wait for a free connection before failing the request
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT') or 30)
+    # Seconds after which connections are replaced, below any server/proxy idle timeout
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE') or 1800)
+    # Test connections on checkout, survives database restarts at the cost of a round trip
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+    # Per-statement timeout in milliseconds (Postgres only, 0: none)
+    DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT') or 30000)
+    # Read replicas (comma separated URIs) serving the GET views of tickets, users and the profile
+    SQLALCHEMY_REPLICA_URIS = [uri.strip() for uri in (os.environ.get('SQLALCHEMY_REPLICA_URIS') or '').split(',')
+                               if uri.strip()]
+    # Seconds a user's reads stay on the primary after their own write, above the usual replication lag
+    REPLICA_STICKY_SECONDS = float(os.environ.get('REPLICA_STICKY_SECONDS') or 5)
+    # Where those deadlines live: memory:// (per process) or redis://host:6379/0 (shared by all workers)
+    REPLICA_STICKY_STORAGE_URL = os.environ.get('REPLICA_STICKY_STORAGE_URL') or 'memory://'
+    # Embed role names, group ids and authz_version in issued tokens (stateless authorization)
+    JWT_EMBED_AUTHZ = os.environ.get('JWT_EMBED_AUTHZ', '').lower() in ('1', 'true', 'yes')
+
+    # Status/group/role rows kept in process memory: reloaded after this many seconds, and on an unknown
+    # name (rows added by another worker or a script) at most this often
+    REFERENCE_CACHE_TTL = int(os.environ.get('REFERENCE_CACHE_TTL') or 300)
+    REFERENCE_CACHE_MISS_RELOAD = float(os.environ.get('REFERENCE_CACHE_MISS_RELOAD') or 1)
+
+    # Authenticated principals (user id, role names, group ids) kept in process memory
+    PRINCIPAL_CACHE_TTL = int(os.environ.get('PRINCIPAL_CACHE_TTL') or 60)
+    PRINCIPAL_CACHE_SIZE = int(os.environ.get('PRINCIPAL_CACHE_SIZE') or 10000)
+
+    # Keyset pagination of GET /tickets
+    TICKETS_PAGE_SIZE = int(os.environ.get('TICKETS_PAGE_SIZE') or 50)
+    TICKETS_MAX_PAGE_SIZE = int(os.environ.get('TICKETS_MAX_PAGE_SIZE') or 500)
+    # Deepest result GET /tickets/search pages to, every page re-ranks all rows before it
+    TICKETS_SEARCH_MAX_OFFSET = int(os.environ.get('TICKETS_SEARCH_MAX_OFFSET') or 10000)
+    # Upper bound of items accepted by POST /tickets/bulk
+    TICKETS_BULK_MAX_ITEMS = int(os.environ.get('TICKETS_BULK_MAX_ITEMS') or 10000)
+    # Rows fetched per server-side cursor round trip by GET /tickets/export
+    TICKETS_EXPORT_CHUNK_SIZE = int(os.environ.get('TICKETS_EXPORT_CHUNK_SIZE') or 1000)
+
+    # Prebuilt OpenAPI spec (python manage.py spec), used when it matches the current routes
+    SWAGGER_SPEC_FILE = os.environ.get('SWAGGER_SPEC_FILE')
+    # Seconds clients and proxies may reuse GET /spec without revalidating
+    SWAGGER_SPEC_MAX_AGE = int(os.environ.get('SWAGGER_SPEC_MAX_AGE') or 300)
+
+    # Password hashing: werkzeug method ('scrypt:32768:8:1', 'pbkdf2:sha256:600000') or 'bcrypt:<rounds>'.
+    # Hashes made with other parameters are upgraded on the next successful login.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'scrypt:32768:8:1'
+    # Hashing processes per app process (0: hash in the request thread)
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or 2)
+    # Queued hashing jobs beyond which login/register answer 503 instead of piling up
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING') or 32)
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT') or 10)
+
+    # Token buckets in front of /login and /register: memory:// (per process) or redis://host:6379/0 (shared)
+    RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    RATELIMIT_STORAGE_URL = os.environ.get('RATELIMIT_STORAGE_URL') or 'memory://'
+    # Attempts per client IP: bucket size and refill per second
+    RATELIMIT_IP_BURST = int(os.environ.get('RATELIMIT_IP_BURST') or 30)
+    RATELIMIT_IP_RATE = float(os.environ.get('RATELIMIT_IP_RATE') or 1)
+    # Failed attempts per username
+    RATELIMIT_USERNAME_BURST = int(os.environ.get('RATELIMIT_USERNAME_BURST') or 5)
+    RATELIMIT_USERNAME_RATE = float(os.environ.get('RATELIMIT_USERNAME_RATE') or 1 / 30)
+    # Seconds an IP that logged in as a username skips that username's bucket (no lockout by others)
+    RATELIMIT_TRUSTED_SECONDS = int(os.environ.get('RATELIMIT_TRUSTED_SECONDS') or 30 * 24 * 3600)
+    # Proxies in front of the app appending to X-Forwarded-For (0: use the peer address)
+    RATELIMIT_PROXY_HOPS = int(os.environ.get('RATELIMIT_PROXY_HOPS') or 0)
+
+    # Request latency/status/SQL metrics on /metrics. With several workers set PROMETHEUS_MULTIPROC_DIR
+    # (environment only, read at import) to an empty directory so all workers are aggregated.
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+    # Response compression negotiated with Accept-Encoding, in this order of preference among the installed
+    # ones: zstd (pip install zstandard), br (pip install brotli), gzip
+    COMPRESS_ENABLED = os.environ.get('COMPRESS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    COMPRESS_ALGORITHMS = [name.strip() for name in (os.environ.get('COMPRESS_ALGORITHMS') or 'zstd,br,gzip').split(',')
+                           if name.strip()]
+    COMPRESS_MIMETYPES = ['application/json', 'application/x-ndjson', 'text/csv', 'text/html', 'text/plain']
+    # Bytes below which bodies are sent as they are, compressing them costs more than it saves
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE') or 1024)
+    COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL') or 6)
+    COMPRESS_BROTLI_LEVEL = int(os.environ.get('COMPRESS_BROTLI_LEVEL') or 4)
+    COMPRESS_ZSTD_LEVEL = int(os.environ.get('COMPRESS_ZSTD_LEVEL') or 3)
+    # Compressed bodies of responses with an ETag kept per process, by ETag and encoding
+    COMPRESS_CACHE_SIZE = int(os.environ.get('COMPRESS_CACHE_SIZE') or 512)
+    COMPRESS_CACHE_TTL = int(os.environ.get('COMPRESS_CACHE_TTL') or 3600)
+
+    # python manage.py serve (gunicorn)
+    SERVER_HOST = os.environ.get('SERVER_HOST') or '0.0.0.0'
+    SERVER_PORT = int(os.environ.get('SERVER_PORT') or 5000)
+    SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS') or multiprocessing.cpu_count() * 2 + 1)
+    SERVER_THREADS = int(os.environ.get('SERVER_THREADS') or 4)
+    SERVER_MAX_REQUESTS = int(os.environ.get('SERVER_MAX_REQUESTS') or 1000)
+    SERVER_MAX_REQUESTS_JITTER = int(os.environ.get('SERVER_MAX_REQUESTS_JITTER') or 100)
+    SERVER_TIMEOUT = int(os.environ.get('SERVER_TIMEOUT') or 30)
+    SERVER_GRACEFUL_TIMEOUT = int(os.environ.get('SERVER_GRACEFUL_TIMEOUT') or 30)
+    SERVER_KEEPALIVE = int(os.environ.get('SERVER_KEEPALIVE') or 5)
 
 config = Config()
@@ -0,0 +1,127 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class HasherBusy(Exception):
+    """Too many hashing jobs are pending (or one timed out), the request should be retried later"""
+
+
+def hash_password(password, method):
+    """Hash with a werkzeug method ('scrypt:32768:8:1', 'pbkdf2:sha256:600000', ...) or 'bcrypt:<rounds>'"""
+    if method.startswith("bcrypt"):
+        rounds = method.partition(":")[2]
+        return bcrypt.hashpw(password.encode(), bcrypt.gensalt(int(rounds or 12))).decode()
+    return generate_password_hash(password, method)
+
+
+def check_password(pwhash, password):
+    if pwhash.startswith("$2"):
+        try:
+            return bcrypt.checkpw(password.encode(), pwhash.encode())
+        except ValueError:
+            return False
+    return check_password_hash(pwhash, password)
+
+
+def hash_parameters(pwhash):
+    """Algorithm and cost a hash was made with, in method notation ('bcrypt:12', 'scrypt:32768:8:1')"""
+    if pwhash.startswith("$2"):
+        return f"bcrypt:{int(pwhash.split('$')[2])}"
+    return pwhash.partition("$")[0]
+
+
+# Configured method -> parameters of the hashes it produces, shared by all apps of the process
+_parameters = {}
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _executor(workers):
+    """Process pool of this process, a pool inherited through fork belongs to the parent and is replaced"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context(method))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _discard_executor(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+
+
+class _HasherState:
+    def __init__(self, config):
+        self.method = config["PASSWORD_HASH_METHOD"]
+        self.workers = config["PASSWORD_HASH_WORKERS"]
+        self.timeout = config["PASSWORD_HASH_TIMEOUT"]
+        self.max_pending = config["PASSWORD_HASH_MAX_PENDING"]
+        self.pending = 0
+        self.lock = threading.Lock()
+
+
+class PasswordHasher:
+    """
+    Password hashing on a bounded process pool, so hashing neither holds the GIL of the
+    request worker nor lets a login storm queue unbounded work.
+
+    PASSWORD_HASH_WORKERS=0 hashes in the calling thread. Beyond PASSWORD_HASH_MAX_PENDING
+    queued jobs, or when a job exceeds PASSWORD_HASH_TIMEOUT, HasherBusy is raised.
+    """
+
+    def init_app(self, app):
+        app.extensions["password_hasher"] = _HasherState(app.config)
+
+    @staticmethod
+    def _state():
+        return current_app.extensions["password_hasher"]
+
+    def _run(self, func, *args):
+        state = self._state()
+        if state.workers <= 0:
+            return func(*args)
+        with state.lock:
+            if state.pending >= state.max_pending:
+                raise HasherBusy()
+            state.pending += 1
+        pool = _executor(state.workers)
+        try:
+            return pool.submit(func, *args).result(timeout=state.timeout)
+        except TimeoutError:
+            raise HasherBusy()
+        except BrokenProcessPool:
+            _discard_executor(pool)
+            raise HasherBusy()
+        finally:
+            with state.lock:
+                state.pending -= 1
+
+    def hash(self, password):
+        return self._run(hash_password, password, self._state().method)
+
+    def check(self, pwhash, password):
+        return self._run(check_password, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """Whether pwhash was made with other parameters than the configured PASSWORD_HASH_METHOD"""
+        method = self._state().method
+        if method not in _parameters:
+            # Werkzeug fills in defaults ('scrypt' -> 'scrypt:32768:8:1'), a real hash tells them
+            _parameters[method] = hash_parameters(self._run(hash_password, "", method))
+        return hash_parameters(pwhash) != _parameters[method]
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,237 @@
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+DEFAULT_MIX = "list=50,detail=30,create=10,update=10"
+WRITES = {"create", "update"}
+
+
+def parse_mix(mix):
+    """'list=50,detail=30' -> {'list': 50.0, 'detail': 30.0}"""
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ("list", "detail", "create", "update"):
+            raise ValueError(f"Unknown operation in mix: {name}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(p / 100 * len(sorted_values)))]
+
+
+class Client:
+    """One keep-alive HTTP connection, reopened when the server closes it"""
+
+    def __init__(self, url, timeout):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.timeout = timeout
+        self.headers = {"Content-Type": "application/json"}
+        self.connection = None
+
+    def request(self, method, path, body=None):
+        payload = json.dumps(body) if body is not None else None
+        for attempt in (1, 2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self.connection.request(method, path, payload, self.headers)
+                response = self.connection.getresponse()
+                data = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # Idle keep-alive connection closed by the server (e.g. worker recycled), retry once
+                self.connection.close()
+                self.connection = None
+                if attempt == 2:
+                    raise
+                continue
+            if response.getheader("Connection", "").lower() == "close":
+                self.connection.close()
+                self.connection = None
+            return response.status, data
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+
+class VirtualUser(threading.Thread):
+    """Closed loop: sends its next request once the previous one is answered and its pacing slot is due"""
+
+    def __init__(self, test, username, password, rng):
+        super().__init__(daemon=True)
+        self.test, self.username, self.password, self.rng = test, username, password, rng
+        self.client = Client(test.url, test.timeout)
+        self.tickets, self.groups, self.manager = [], [], False
+
+    def login(self, attempts=5):
+        for _ in range(attempts):
+            status, data = self.client.request(
+                "POST", "/login", {"username": self.username, "password": self.password}
+            )
+            if status != 429:
+                break
+            # All synthetic users share one IP, the server's login throttling applies to them
+            time.sleep(1)
+        if status != 200:
+            return False
+        self.client.headers["Authorization"] = json.loads(data)["token"]
+        status, data = self.client.request("GET", "/profile")
+        if status != 200:
+            return False
+        profile = json.loads(data)
+        self.groups = [group["name"] for group in profile.get("groups", [])]
+        self.manager = any(role["name"] in ("Manager", "Admin") for role in profile.get("roles", []))
+        return True
+
+    def call(self, operation):
+        if operation == "list" or (operation != "create" and not self.tickets):
+            status, data = self.client.request("GET", "/tickets")
+            if status == 200:
+                self.tickets = json.loads(data)["tickets"] or self.tickets
+            return "list", status
+        if operation == "detail":
+            ticket = self.rng.choice(self.tickets)
+            return operation, self.client.request("GET", f'/tickets/{ticket["id"]}')[0]
+        if operation == "create":
+            body = {"note": "Load test", "status": "Pending", "group": self.rng.choice(self.groups), "user_id": ""}
+            return operation, self.client.request("POST", "/create-ticket", body)[0]
+        ticket = self.rng.choice(self.tickets)
+        body = {
+            "note": ticket["note"],
+            "status": self.rng.choice(("Pending", "In review", "Closed")),
+            "group": ticket["group"]["name"],
+            "user_id": (ticket.get("user") or {}).get("id") or "",
+        }
+        return operation, self.client.request("PUT", f'/tickets/{ticket["id"]}', body)[0]
+
+    def run(self):
+        test = self.test
+        # Only managers may create and update tickets
+        operations = [op for op in test.mix if (self.manager and self.groups) or op not in WRITES]
+        if not operations:
+            return
+        weights = [test.mix[op] for op in operations]
+        next_at = time.monotonic() + self.rng.random() * test.interval
+        while not test.stopping.is_set():
+            if test.interval:
+                delay = next_at - time.monotonic()
+                if delay > 0 and test.stopping.wait(delay):
+                    break
+                # Running late does not cause a burst to catch up
+                next_at = max(next_at + test.interval, time.monotonic())
+            operation = self.rng.choices(operations, weights)[0]
+            started = time.perf_counter()
+            try:
+                operation, status = self.call(operation)
+            except (OSError, http.client.HTTPException, ValueError):
+                status = None
+            test.record(operation, status, time.perf_counter() - started)
+        self.client.close()
+
+
+class LoadTest:
+    """
+    Closed-loop load test: `users` synthetic users (usernames from a pattern, e.g. the ones
+    'manage.py seed-bulk' creates), one thread and keep-alive connection each, drive a weighted
+    mix of ticket list/detail/create/update calls. With `rate`, the users together pace themselves
+    to that many requests per second; a server that cannot keep up lowers the achieved rate.
+    """
+
+    def __init__(self, url, users, password, mix, rate, duration, username_pattern="user{}", first_id=1,
+                 timeout=30, seed=0):
+        self.url = url
+        self.mix = parse_mix(mix) if isinstance(mix, str) else mix
+        self.rate, self.duration, self.timeout = rate, duration, timeout
+        self.interval = users / rate if rate else 0
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.samples = {}
+        rng = random.Random(seed)
+        self.users = [
+            VirtualUser(self, username_pattern.format(first_id + i), password, random.Random(rng.random()))
+            for i in range(users)
+        ]
+
+    def record(self, operation, status, elapsed):
+        with self.lock:
+            self.samples.setdefault(operation, []).append((status, elapsed))
+
+    def run(self, log=print):
+        logged_in = [user for user in self.users if user.login()]
+        log(f"{len(logged_in)}/{len(self.users)} users logged in, "
+            f"{sum(user.manager for user in logged_in)} of them may write")
+        if not logged_in:
+            raise RuntimeError("No user could log in, check the username pattern and password")
+        started = time.perf_counter()
+        for user in logged_in:
+            user.start()
+        self.stopping.wait(self.duration)
+        self.stopping.set()
+        for user in logged_in:
+            user.join(self.timeout)
+        return self.report(time.perf_counter() - started)
+
+    def report(self, elapsed):
+        def summary(samples):
+            latencies = sorted(latency * 1000 for _, latency in samples)
+            errors = sum(1 for status, _ in samples if status is None or status >= 400)
+            return {
+                "requests": len(samples),
+                "errors": errors,
+                "error_rate": errors / len(samples) if samples else 0.0,
+                "throughput_rps": len(samples) / elapsed,
+                "p50_ms": percentile(latencies, 50),
+                "p95_ms": percentile(latencies, 95),
+                "p99_ms": percentile(latencies, 99),
+                "max_ms": latencies[-1] if latencies else None,
+            }
+
+        with self.lock:
+            endpoints = {operation: summary(samples) for operation, samples in sorted(self.samples.items())}
+            total = summary([sample for samples in self.samples.values() for sample in samples])
+        return {"duration_s": elapsed, "users": len(self.users), "target_rps": self.rate,
+                "endpoints": endpoints, "total": total}
+
+
+def format_report(report):
+    lines = [f'{"endpoint":<8} {"requests":>9} {"errors":>7} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8}']
+    rows = list(report["endpoints"].items()) + [("total", report["total"])]
+    for name, stats in rows:
+        if not stats["requests"]:
+            continue
+        lines.append(f'{name:<8} {stats["requests"]:>9} {stats["error_rate"]:>7.1%} {stats["throughput_rps"]:>8.1f} '
+                     f'{stats["p50_ms"]:>8.1f} {stats["p95_ms"]:>8.1f} {stats["p99_ms"]:>8.1f}')
+    return "\n".join(lines)
+
+
+def start_server(bind, args=(), wait=30):
+    """'manage.py serve' in a subprocess (login throttling off), returned once it answers on `bind`"""
+    env = dict(os.environ, RATELIMIT_ENABLED="false")
+    process = subprocess.Popen([sys.executable, "manage.py", "serve", "--bind", bind, *args], env=env)
+    host, _, port = bind.rpartition(":")
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            connection = http.client.HTTPConnection(host, int(port), timeout=1)
+            connection.request("GET", "/spec")
+            connection.getresponse().read()
+            connection.close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"Server did not answer on {bind} within {wait}s")
@@ -0,0 +1,104 @@
+import os
+import time
+
+from flask import Response, g, has_request_context, request
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, \
+    REGISTRY, generate_latest
+from prometheus_client import multiprocess
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# In multiprocess mode values live in files of this directory from the first metric on
+if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+# Label values are route templates ('/tickets/<int:ticket_id>'), never raw paths, so cardinality stays bounded
+UNMATCHED = "unmatched"
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Request handling time, streamed responses included",
+    ["endpoint", "method"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUESTS = Counter("http_requests_total", "Requests by response status", ["endpoint", "method", "status"])
+IN_PROGRESS = Gauge("http_requests_in_progress", "Requests being handled", multiprocess_mode="livesum")
+SQL_STATEMENTS = Histogram(
+    "http_request_sql_statements", "SQL statements executed per request",
+    ["endpoint", "method"],
+    buckets=(0, 1, 2, 3, 5, 10, 25, 50, 100),
+)
+
+
+# Labelled children by label values, labels() itself costs more than observing
+_children = {}
+
+
+def _child(metric, *labels):
+    key = (metric, labels)
+    child = _children.get(key)
+    if child is None:
+        child = _children[key] = metric.labels(*labels)
+    return child
+
+
+def _endpoint():
+    rule = request.url_rule
+    return rule.rule if rule is not None else UNMATCHED
+
+
+def _before_request():
+    g.metrics_started = time.perf_counter()
+    g.sql_statements = 0
+    IN_PROGRESS.inc()
+
+
+def _after_request(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+def _teardown_request(exception):
+    started = g.pop("metrics_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    IN_PROGRESS.dec()
+    endpoint, method = _endpoint(), request.method
+    status = g.pop("metrics_status", 500)
+    _child(REQUEST_LATENCY, endpoint, method).observe(elapsed)
+    _child(REQUESTS, endpoint, method, status).inc()
+    _child(SQL_STATEMENTS, endpoint, method).observe(g.pop("sql_statements", 0))
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and "sql_statements" in g:
+        g.sql_statements += 1
+
+
+def metrics_registry():
+    """Registry to expose: aggregated over all worker processes in multiprocess mode"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def init_app(app):
+    """Instrument every request and serve the metrics in Prometheus text format on /metrics"""
+    if not app.config["METRICS_ENABLED"]:
+        return
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(generate_latest(metrics_registry()), mimetype=CONTENT_TYPE_LATEST)
+
+
+def mark_process_dead(pid):
+    """Drop a stopped worker's live gauges from the multiprocess files"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
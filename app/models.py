@@ -1,15 +1,15 @@
-from werkzeug.security import generate_password_hash, check_password_hash
-
 from . import db
+from .hashing import password_hasher
 
+# Composite primary keys serve user -> roles/groups loads, the extra index the reverse direction
 user_roles = db.Table('user_roles',
-                      db.Column('user_id', db.Integer, db.ForeignKey('user.id')),
-                      db.Column('role_id', db.Integer, db.ForeignKey('role.id'))
+                      db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
+                      db.Column('role_id', db.Integer, db.ForeignKey('role.id'), primary_key=True, index=True)
                       )
 
 user_groups = db.Table('user_groups',
-                       db.Column('user_id', db.Integer, db.ForeignKey('user.id')),
-                       db.Column('group_id', db.Integer, db.ForeignKey('group.id'))
+                       db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
+                       db.Column('group_id', db.Integer, db.ForeignKey('group.id'), primary_key=True, index=True)
                        )
 
 
@@ -17,15 +17,24 @@ class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password = db.Column(db.String(128), nullable=False)
+    password = db.Column(db.String(255), nullable=False)
+    # Bumped on every role/group change, tokens embedding an older one are rejected
+    authz_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # Row version, bumped by the ORM on every UPDATE, used for ETags
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     roles = db.relationship('Role', secondary=user_roles, backref=db.backref('users', lazy='dynamic'))
     groups = db.relationship('Group', secondary=user_groups, backref=db.backref('users', lazy='dynamic'))
 
+    __mapper_args__ = {'version_id_col': version}
+
     def set_password(self, password):
-        self.password = generate_password_hash(password)
+        self.password = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password, password)
+        return password_hasher.check(self.password, password)
+
+    def password_needs_rehash(self):
+        return password_hasher.needs_rehash(self.password)
 
     def __repr__(self):
         return f'{self.username} {self.email}'
@@ -56,11 +65,20 @@ class Status(db.Model):
 
 
 class Ticket(db.Model):
+    __table_args__ = (
+        # Filter by status and keyset pagination sorted by status
+        db.Index('ix_ticket_status_id_id', 'status_id', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     note = db.Column(db.Text)
     status_id = db.Column(db.Integer, db.ForeignKey('status.id'))
     status = db.relationship('Status', backref='tickets')
-    group_id = db.Column(db.Integer, db.ForeignKey('group.id'))
+    group_id = db.Column(db.Integer, db.ForeignKey('group.id'), index=True)
     group = db.relationship('Group', backref='tickets')
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
     user = db.relationship('User', backref='tickets')
+    # Row version, bumped by the ORM on every UPDATE (bulk UPDATEs bump it explicitly), used for ETags
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    __mapper_args__ = {'version_id_col': version}
@@ -0,0 +1,94 @@
+import threading
+import time
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import QueuePool
+
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool counting checkouts, time spent waiting for a connection, timeouts and overflow"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = {
+            "checkouts": 0,
+            "connects": 0,
+            "disconnects": 0,
+            "timeouts": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            "overflow_max": 0,
+        }
+        self._stats_lock = threading.Lock()
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _create_connection(self):
+        self._count("connects")
+        return super()._create_connection()
+
+    def _invalidate(self, connection, exception=None, _checkin=True):
+        # A disconnect was detected (e.g. the server restarted), the whole pool gets recycled
+        self._count("disconnects")
+        return super()._invalidate(connection, exception, _checkin)
+
+    def _do_get(self):
+        # Includes opening a new connection when the pool has none idle
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except TimeoutError:
+            self._count("timeouts")
+            raise
+        waited = time.perf_counter() - started
+        with self._stats_lock:
+            stats = self.stats
+            stats["checkouts"] += 1
+            stats["wait_seconds_total"] += waited
+            stats["wait_seconds_max"] = max(stats["wait_seconds_max"], waited)
+            stats["overflow_max"] = max(stats["overflow_max"], self.overflow())
+        return connection
+
+
+def engine_options(config, uri=None):
+    """
+    SQLALCHEMY_ENGINE_OPTIONS from the DB_POOL_* / DB_STATEMENT_TIMEOUT settings, for the
+    primary database or the given one (e.g. a replica).
+
+    Pool sizing only applies to URLs served by a QueuePool (not e.g. in-memory SQLite),
+    the statement timeout only to Postgres.
+    """
+    url = make_url(uri or config["SQLALCHEMY_DATABASE_URI"])
+    options = {"pool_pre_ping": config["DB_POOL_PRE_PING"]}
+    if issubclass(url.get_dialect().get_pool_class(url), QueuePool):
+        options.update(
+            poolclass=MeteredQueuePool,
+            pool_size=config["DB_POOL_SIZE"],
+            max_overflow=config["DB_MAX_OVERFLOW"],
+            pool_timeout=config["DB_POOL_TIMEOUT"],
+            pool_recycle=config["DB_POOL_RECYCLE"],
+        )
+    if url.get_backend_name() == "postgresql" and config["DB_STATEMENT_TIMEOUT"]:
+        options["connect_args"] = {"options": f'-c statement_timeout={config["DB_STATEMENT_TIMEOUT"]}'}
+    return options
+
+
+def pool_stats(engine):
+    """Current state and counters of an engine's pool (in this process)"""
+    pool = engine.pool
+    stats = {"pool": type(pool).__name__, "status": pool.status()}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+            max_overflow=pool._max_overflow,
+        )
+    if isinstance(pool, MeteredQueuePool):
+        with pool._stats_lock:
+            stats.update(pool.stats)
+    return stats
@@ -0,0 +1,162 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, request
+
+
+class MemoryBackend:
+    """Token buckets in process memory, each worker process limits on its own"""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._marks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, burst, rate, cost=1):
+        """
+        Refill the bucket, then take `cost` tokens if at least one is available.
+        Returns 0 when allowed, otherwise the seconds until a token is available.
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0
+            if tokens < 1:
+                wait = (1 - tokens) / rate
+            else:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            # Forgetting the least recent buckets only ever lets their keys start over full
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def mark(self, key, seconds):
+        with self._lock:
+            self._marks[key] = time.monotonic() + seconds
+            self._marks.move_to_end(key)
+            while len(self._marks) > self.max_keys:
+                self._marks.popitem(last=False)
+
+    def is_marked(self, key):
+        until = self._marks.get(key)
+        return until is not None and until > time.monotonic()
+
+
+class RedisBackend:
+    """Token buckets in Redis, shared by all workers and hosts; one atomic script call per take"""
+
+    script = """
+    local burst, rate, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local clock = redis.call('TIME')
+    local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(bucket[1]) or burst
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+    local wait = 0
+    if tokens < 1 then
+        wait = (1 - tokens) / rate
+    else
+        tokens = tokens - cost
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return tostring(wait)
+    """
+
+    def __init__(self, url, prefix="ratelimit:"):
+        import redis  # optional dependency, only needed for a shared backend
+
+        self.prefix = prefix
+        self._redis = redis.Redis.from_url(url)
+        self._take = self._redis.register_script(self.script)
+
+    def take(self, key, burst, rate, cost=1):
+        return float(self._take(keys=[self.prefix + key], args=[burst, rate, cost]))
+
+    def mark(self, key, seconds):
+        self._redis.set(self.prefix + key, 1, px=max(1, int(seconds * 1000)))
+
+    def is_marked(self, key):
+        return bool(self._redis.exists(self.prefix + key))
+
+
+def create_backend(url):
+    if not url or url.startswith("memory://"):
+        return MemoryBackend()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url)
+    raise ValueError(f"Unsupported RATELIMIT_STORAGE_URL: {url}")
+
+
+class RateLimiter:
+    """
+    Token buckets per client IP and per username in front of the credential endpoints.
+
+    Every attempt takes a token from the IP bucket. The username bucket is only checked up
+    front and charged when the attempt fails, so an attacker guessing one account's password
+    runs dry quickly while the owner's successful logins cost nothing. An IP that succeeded
+    for a username within RATELIMIT_TRUSTED_SECONDS skips that username's bucket, so failed
+    guesses from elsewhere cannot lock the owner out. All checks happen before the view runs,
+    i.e. before any query or password hash.
+    """
+
+    def init_app(self, app):
+        app.extensions["ratelimit"] = create_backend(app.config["RATELIMIT_STORAGE_URL"])
+
+    @staticmethod
+    def client_ip():
+        hops = current_app.config["RATELIMIT_PROXY_HOPS"]
+        if hops:
+            # Client address as appended by the outermost of our own proxies
+            forwarded = [a.strip() for a in request.headers.get("X-Forwarded-For", "").split(",") if a.strip()]
+            if len(forwarded) >= hops:
+                return forwarded[-hops]
+        return request.remote_addr
+
+    def limit(self, scope):
+        def wrapper(f):
+            @wraps(f)
+            def wrap(*args, **kwargs):
+                config = current_app.config
+                if not config["RATELIMIT_ENABLED"]:
+                    return f(*args, **kwargs)
+                backend = current_app.extensions["ratelimit"]
+
+                ip = self.client_ip()
+                wait = backend.take(f"{scope}:ip:{ip}", config["RATELIMIT_IP_BURST"], config["RATELIMIT_IP_RATE"])
+                data = request.get_json(silent=True)
+                username = data.get("username") if isinstance(data, dict) else None
+                user_key = trusted_key = None
+                if isinstance(username, str) and not wait:
+                    username = username.strip().lower()
+                    trusted_key = f"{scope}:ok:{username}:{ip}"
+                    if not backend.is_marked(trusted_key):
+                        user_key = f"{scope}:user:{username}"
+                        wait = backend.take(user_key, config["RATELIMIT_USERNAME_BURST"],
+                                            config["RATELIMIT_USERNAME_RATE"], cost=0)
+                if wait:
+                    return ({'message': 'Too many attempts, try again later'}, 429,
+                            {'Retry-After': str(math.ceil(wait))})
+
+                result = f(*args, **kwargs)
+                status = result[1] if isinstance(result, tuple) else getattr(result, "status_code", 200)
+                if user_key and 400 <= status < 500:
+                    backend.take(user_key, config["RATELIMIT_USERNAME_BURST"], config["RATELIMIT_USERNAME_RATE"])
+                elif trusted_key and 200 <= status < 300:
+                    backend.mark(trusted_key, config["RATELIMIT_TRUSTED_SECONDS"])
+                return result
+
+            return wrap
+
+        return wrapper
+
+
+limiter = RateLimiter()
@@ -0,0 +1,158 @@
+import random
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from itertools import chain
+
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+
+from . import db
+from .models import User
+from .pool import engine_options
+
+# SQLALCHEMY_BINDS keys of the replica engines: replica0, replica1, ...
+BIND_PREFIX = "replica"
+
+
+def replica_binds(config):
+    """SQLALCHEMY_BINDS entries for SQLALCHEMY_REPLICA_URIS, pooled like the primary"""
+    return {
+        f"{BIND_PREFIX}{i}": {"url": uri, **engine_options(config, uri)}
+        for i, uri in enumerate(config["SQLALCHEMY_REPLICA_URIS"])
+    }
+
+
+class MemoryStickyStore:
+    """Users' read-your-writes deadlines in process memory, only the worker that served the write knows"""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._until = OrderedDict()
+        self._lock = threading.Lock()
+
+    def mark(self, user_id, seconds):
+        with self._lock:
+            self._until[user_id] = time.monotonic() + seconds
+            self._until.move_to_end(user_id)
+            while len(self._until) > self.max_keys:
+                self._until.popitem(last=False)
+
+    def is_sticky(self, user_id):
+        until = self._until.get(user_id)
+        return until is not None and until > time.monotonic()
+
+
+class RedisStickyStore:
+    """Users' read-your-writes deadlines in Redis, shared by all workers and hosts"""
+
+    def __init__(self, url, prefix="replica-sticky:"):
+        import redis  # optional dependency, only needed for a shared store
+
+        self.prefix = prefix
+        self._redis = redis.Redis.from_url(url)
+
+    def mark(self, user_id, seconds):
+        self._redis.set(f"{self.prefix}{user_id}", 1, px=max(1, int(seconds * 1000)))
+
+    def is_sticky(self, user_id):
+        return bool(self._redis.exists(f"{self.prefix}{user_id}"))
+
+
+def create_sticky_store(url):
+    if not url or url.startswith("memory://"):
+        return MemoryStickyStore()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStickyStore(url)
+    raise ValueError(f"Unsupported REPLICA_STICKY_STORAGE_URL: {url}")
+
+
+class ReplicaRouter:
+    """
+    Sends the SELECTs of `read_only` views to a randomly picked replica, everything else
+    (writes, flushes, undecorated views, authentication) to the primary.
+
+    After a user's own committed write, that user's reads stay on the primary for
+    REPLICA_STICKY_SECONDS, long enough for the replicas to catch up, so they never
+    see their data go back in time.
+    """
+
+    def init_app(self, app):
+        app.extensions["replicas"] = {
+            "keys": [key for key in app.config.get("SQLALCHEMY_BINDS", {}) if key.startswith(BIND_PREFIX)],
+            "sticky": create_sticky_store(app.config["REPLICA_STICKY_STORAGE_URL"]),
+        }
+
+    def read_only(self, f):
+        """View decorator (below login_required): the view's queries may be served by a replica"""
+        @wraps(f)
+        def wrap(*args, **kwargs):
+            state = current_app.extensions["replicas"]
+            user = kwargs.get("user")
+            if not state["keys"] or (user is not None and state["sticky"].is_sticky(user.id)):
+                return f(*args, **kwargs)
+            g.db_replica = db.engines[random.choice(state["keys"])]
+            try:
+                return f(*args, **kwargs)
+            finally:
+                g.pop("db_replica", None)
+
+        return wrap
+
+    def mark_written(self, user_ids):
+        state = current_app.extensions.get("replicas")
+        if state and state["keys"]:
+            for user_id in user_ids:
+                state["sticky"].mark(user_id, current_app.config["REPLICA_STICKY_SECONDS"])
+
+
+replicas = ReplicaRouter()
+
+
+def _request_user_id():
+    from .utils import decode_token
+
+    token = request.headers.get("Authorization")
+    payload = decode_token(token) if token else None
+    return payload.get("sub") if payload else None
+
+
+@event.listens_for(db.session, "do_orm_execute")
+def _route_to_replica(orm_execute_state):
+    if orm_execute_state.is_select and has_app_context():
+        engine = g.get("db_replica")
+        if engine is not None:
+            orm_execute_state.bind_arguments["bind"] = engine
+    elif orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        # Bulk statements never flush, they count as writes too
+        orm_execute_state.session.info["replica_wrote"] = True
+
+
+@event.listens_for(db.session, "after_flush")
+def _collect_writes(session, flush_context):
+    session.info["replica_wrote"] = True
+    # Written user rows (e.g. registration, password rehash on login) make their owner sticky
+    users = {obj.id for obj in chain(session.new, session.dirty, session.deleted) if isinstance(obj, User)}
+    if users:
+        session.info.setdefault("replica_users", set()).update(users)
+
+
+@event.listens_for(db.session, "after_commit")
+def _stick_to_primary(session):
+    wrote = session.info.pop("replica_wrote", False)
+    users = session.info.pop("replica_users", set())
+    if not wrote or not has_app_context():
+        return
+    if has_request_context():
+        # The author of the write, whatever rows it touched
+        user_id = _request_user_id()
+        if user_id is not None:
+            users.add(user_id)
+    replicas.mark_written(users)
+
+
+@event.listens_for(db.session, "after_rollback")
+def _discard_writes(session):
+    session.info.pop("replica_wrote", None)
+    session.info.pop("replica_users", None)
@@ -1,5 +1,6 @@
+from .admin import PoolStats
 from .auth import Register, UserProfile, Login
-from .tickets import TicketList, TicketCreate, TicketDetail
+from .tickets import TicketList, TicketCreate, TicketDetail, TicketExport, TicketBulk, TicketSearch
 from .users import UserList, UserDetail
 
 
@@ -13,4 +14,9 @@ def initialize_resources(api):
 
     api.add_resource(TicketList, '/tickets')
     api.add_resource(TicketDetail, '/tickets/<int:ticket_id>')
+    api.add_resource(TicketExport, '/tickets/export')
+    api.add_resource(TicketBulk, '/tickets/bulk')
+    api.add_resource(TicketSearch, '/tickets/search')
     api.add_resource(TicketCreate, '/create-ticket')
+
+    api.add_resource(PoolStats, '/admin/pool')
@@ -0,0 +1,63 @@
+import os
+
+from flask_restful import Resource
+
+from app import db
+from app.pool import pool_stats
+from app.utils import login_required, role_required
+
+
+class PoolStats(Resource):
+
+    @login_required
+    @role_required('Admin')
+    def get(self, *args, **kwargs):
+        """
+        Connection pool state and counters of the worker process serving the request
+        ---
+        tags:
+          - admin
+        security:
+          - BearerAuth: []
+        parameters:
+          - name: Authorization
+            in: header
+            required: true
+            type: string
+            description: JWT token for authorization (e.g., Bearer <token>)
+        responses:
+          200:
+            description: Pool statistics per database engine, counters are per process since its start
+            schema:
+              type: object
+              properties:
+                pid:
+                  type: integer
+                  description: Process the numbers belong to
+                engines:
+                  type: object
+                  description: Bind name ("default" for the primary database) -> pool statistics
+                  additionalProperties:
+                    type: object
+                    properties:
+                      size:
+                        type: integer
+                      checked_out:
+                        type: integer
+                      overflow:
+                        type: integer
+                      checkouts:
+                        type: integer
+                      timeouts:
+                        type: integer
+                      wait_seconds_total:
+                        type: number
+                      wait_seconds_max:
+                        type: number
+          401:
+            description: Unauthorized (invalid or missing token)
+          403:
+            description: Forbidden (user does not have required role)
+        """
+        engines = {key or "default": pool_stats(engine) for key, engine in db.engines.items()}
+        return {"pid": os.getpid(), "engines": engines}, 200
@@ -1,10 +1,14 @@
-from flask import request, jsonify
+from flask import request, jsonify, current_app
 from flask_restful import Resource
+from sqlalchemy.orm.exc import StaleDataError
 
 from app import db
+from app.hashing import HasherBusy
 from app.models import User
+from app.ratelimit import limiter
+from app.replicas import replicas
 from app.schemas import user_schema
-from app.utils import generate_token, login_required, validate_email
+from app.utils import generate_token, login_required, validate_email, get_user_with_relations, authz_claims
 
 
 class Register(Resource):
@@ -47,6 +51,7 @@ class Register(Resource):
             "confirm_password": "<PASSWORD>",
         })
 
+    @limiter.limit("register")
     def post(self):
         """
         Register a new user
@@ -81,6 +86,10 @@ class Register(Resource):
             description: User registered successfully
           400:
             description: Bad request (e.g., validation errors)
+          429:
+            description: Too many attempts from this client or for this username, see Retry-After
+          503:
+            description: Password hashing is saturated, retry later
         """
         data = request.get_json()
 
@@ -102,17 +111,26 @@ class Register(Resource):
             return errors, 400
         user = User(
             username=data['username'],
-            email=data['email']
+            email=data['email'],
+            roles=[],
+            groups=[]
         )
-        user.set_password(data['password'])
+        try:
+            user.set_password(data['password'])
+        except HasherBusy:
+            return {'message': 'Server is busy, try again later'}, 503, {'Retry-After': '1'}
 
         db.session.add(user)
+        # Dump before committing, commit expires the user and would reload it
+        db.session.flush()
+        body = user_schema.dump(user)
         db.session.commit()
 
-        return user_schema.dump(user), 201
+        return body, 201
 
 
 class Login(Resource):
+    @limiter.limit("login")
     def post(self):
         """
         Login a user
@@ -152,14 +170,33 @@ class Login(Resource):
                     type: string
                     description: Error message
                     example: Invalid credentials
+            429:
+              description: Too many attempts from this client or for this username, see Retry-After
+            503:
+              description: Password hashing is saturated, retry later
             500:
               description: Internal server error
         """
         data = request.get_json()
         user = User.query.filter_by(username=data['username']).first()
 
-        if user and user.check_password(data['password']):
-            token = generate_token(user.id)
+        try:
+            valid = user is not None and user.check_password(data['password'])
+        except HasherBusy:
+            return {'message': 'Server is busy, try again later'}, 503, {'Retry-After': '1'}
+
+        if valid:
+            try:
+                if user.password_needs_rehash():
+                    # Stored with outdated algorithm/cost parameters, upgrade while the password is at hand
+                    user.set_password(data['password'])
+                    db.session.commit()
+            except HasherBusy:
+                pass  # upgraded on a later login
+            except StaleDataError:
+                db.session.rollback()  # a concurrent login upgraded it already
+            claims = authz_claims(user) if current_app.config["JWT_EMBED_AUTHZ"] else None
+            token = generate_token(user.id, claims)
             return {'token': token}, 200
 
         return {'message': 'Invalid credentials'}, 401
@@ -168,6 +205,7 @@ class Login(Resource):
 class UserProfile(Resource):
 
     @login_required
+    @replicas.read_only
     def get(self, **kwargs):
         """
         Show user profile details
@@ -207,4 +245,4 @@ class UserProfile(Resource):
           500:
             description: Internal server error
         """
-        return user_schema.dump(kwargs.pop("user")), 200
+        return user_schema.dump(get_user_with_relations(kwargs.pop("user").id)), 200
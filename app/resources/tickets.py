@@ -1,15 +1,31 @@
-from flask import request, jsonify
+import csv
+import io
+import json
+
+from flask import request, jsonify, current_app, stream_with_context, Response
 from flask_restful import Resource
-from sqlalchemy import or_
+from sqlalchemy import select, insert, update
+from sqlalchemy.orm.exc import StaleDataError
 
 from app import db
-from app.models import Ticket, Role
+from app.models import Ticket, Status, Group, User
+from app.replicas import replicas
 from app.schemas import ticket_schema
-from app.utils import login_required, role_required, get_ticket_by_id, validate_ticket
+from app.search import search_terms, search_tickets
+from app.utils import login_required, role_required, get_ticket_by_id, validate_ticket, get_page_args, \
+    encode_cursor, ticket_query, visible_tickets, validate_tickets, own_tickets, validate_ticket_changes, \
+    get_ticket_list_args, keyset_after, ticket_load_options, ticket_etag_key, make_etag, not_modified, is_id
+
+EXPORT_FIELDS = ("id", "note", "status", "group", "user_id", "username")
+EXPORT_MIMETYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
 
 
 class TicketList(Resource):
     @login_required
+    @replicas.read_only
     def get(self, *args, **kwargs):
         """
         Get user tickets
@@ -24,11 +40,69 @@ class TicketList(Resource):
             required: true
             type: string
             description: JWT token for authorization (e.g., Bearer <token>)
+          - name: limit
+            in: query
+            required: false
+            type: integer
+            description: Page size, capped by the server (TICKETS_MAX_PAGE_SIZE)
+          - name: cursor
+            in: query
+            required: false
+            type: string
+            description: Opaque cursor taken from next_cursor of the previous page (same filters and sort)
+          - name: status
+            in: query
+            required: false
+            type: string
+            description: Only tickets with this status
+          - name: group
+            in: query
+            required: false
+            type: string
+            description: Only tickets of this group
+          - name: assignee
+            in: query
+            required: false
+            type: integer
+            description: Only tickets assigned to this user id
+          - name: unassigned
+            in: query
+            required: false
+            type: boolean
+            description: Only tickets not assigned to anybody
+          - name: sort
+            in: query
+            required: false
+            type: string
+            enum: [id, -id, status, -status]
+            default: id
+            description: Sort key, status sorts in workflow (status id) order, - prefix for descending
+          - name: If-None-Match
+            in: header
+            required: false
+            type: string
+            description: ETag of a previously fetched page
         responses:
           200:
-            description: Tickets retrieved successfully
+            description: Tickets retrieved successfully, ETag header identifies the page content
             schema:
-              type: array
+              type: object
+              properties:
+                tickets:
+                  type: array
+                next_cursor:
+                  type: string
+                  description: Cursor of the next page, null on the last one
+          304:
+            description: Page unchanged since the ETag given in If-None-Match
+          400:
+            description: Bad request (invalid limit, cursor, filter or sort)
+            schema:
+              type: object
+              properties:
+                message:
+                  type: object
+                  description: Error messages
           401:
             description: Unauthorized (invalid or missing token)
             schema:
@@ -42,20 +116,219 @@ class TicketList(Resource):
             description: Internal server error
         """
         user = kwargs["user"]
-        if "Admin" in str(user.roles):
-            tickets = Ticket.query.all()
-        else:
-            tickets = Ticket.query.filter(
-                or_(
-                    Ticket.group_id.in_([g.id for g in user.groups]),
-                    Ticket.user_id == user.id
-                )
-            ).all()
-        return ticket_schema.dump(tickets, many=True), 200
+        errors, criteria, sort_columns, descending = get_ticket_list_args()
+        page_errors, limit, after = get_page_args(len(sort_columns))
+        errors.update(page_errors)
+        if errors:
+            return {"message": errors}, 400
+
+        query = visible_tickets(Ticket.query, user).filter(*criteria)
+        if after:
+            query = query.filter(keyset_after(sort_columns, after, descending))
+        query = query.order_by(*[column.desc() if descending else column for column in sort_columns])
+
+        # Everything but the rows' versions that shapes the page: the same rows make different pages
+        # (order, next_cursor) for different limits and sorts
+        page = (limit, [column.key for column in sort_columns], descending,
+                sorted((key, value) for key, value in request.args.items(multi=True) if key != "cursor"))
+
+        if request.if_none_match:
+            # Conditional GET: compare versions of the page's rows before loading them
+            keys = query.outerjoin(Ticket.user).with_entities(Ticket.id, Ticket.version, User.version)
+            response = not_modified(make_etag("tickets", page, keys.limit(limit + 1).all()))
+            if response:
+                return response
+
+        # One extra row tells whether there is a next page
+        tickets = query.options(*ticket_load_options()).limit(limit + 1).all()
+        etag = make_etag("tickets", page, [ticket_etag_key(ticket) for ticket in tickets])
+
+        next_cursor = None
+        if len(tickets) > limit:
+            tickets = tickets[:limit]
+            next_cursor = encode_cursor([getattr(tickets[-1], column.key) for column in sort_columns])
+        body = {"tickets": ticket_schema.dump(tickets, many=True), "next_cursor": next_cursor}
+        return body, 200, {"ETag": f'"{etag}"'}
+
+
+class TicketSearch(Resource):
+    @login_required
+    def get(self, *args, **kwargs):
+        """
+        Full-text search over ticket notes
+        ---
+        tags:
+            - tickets
+        security:
+          - BearerAuth: []
+        parameters:
+          - name: Authorization
+            in: header
+            required: true
+            type: string
+            description: JWT token for authorization (e.g., Bearer <token>)
+          - name: q
+            in: query
+            required: true
+            type: string
+            description: Words that must all appear in the note
+          - name: limit
+            in: query
+            required: false
+            type: integer
+            description: Page size, capped by the server (TICKETS_MAX_PAGE_SIZE)
+          - name: cursor
+            in: query
+            required: false
+            type: string
+            description: Opaque cursor taken from next_cursor of the previous page
+        responses:
+          200:
+            description: Visible tickets matching the query, best matches first (up to TICKETS_SEARCH_MAX_OFFSET)
+            schema:
+              type: object
+              properties:
+                tickets:
+                  type: array
+                next_cursor:
+                  type: string
+                  description: Cursor of the next page, null on the last one
+          400:
+            description: Bad request (empty query, invalid limit or cursor)
+            schema:
+              type: object
+              properties:
+                message:
+                  type: object
+                  description: Error messages
+          401:
+            description: Unauthorized (invalid or missing token)
+            schema:
+              type: object
+              properties:
+                message:
+                  type: string
+                  description: Error message
+                  example: Unauthorized
+          500:
+            description: Internal server error
+        """
+        errors, limit, after = get_page_args()
+        # Relevance is computed per query, so pages are positions in the ranked result
+        offset = after[0] if after else 0
+        max_offset = current_app.config["TICKETS_SEARCH_MAX_OFFSET"]
+        if "cursor" not in errors and not 0 <= offset <= max_offset:
+            errors["cursor"] = "Invalid cursor"
+        terms = search_terms(request.args.get("q"))
+        if not terms:
+            errors["q"] = "Nothing to search for"
+        if errors:
+            return {"message": errors}, 400
+
+        query = search_tickets(visible_tickets(ticket_query(), kwargs["user"]), terms)
+        tickets = query.offset(offset).limit(limit + 1).all()
+
+        next_cursor = None
+        if len(tickets) > limit and offset + limit <= max_offset:
+            tickets = tickets[:limit]
+            next_cursor = encode_cursor([offset + limit])
+        return {"tickets": ticket_schema.dump(tickets, many=True), "next_cursor": next_cursor}, 200
+
+
+class TicketExport(Resource):
+    @login_required
+    def get(self, *args, **kwargs):
+        """
+        Export all visible tickets as a stream
+        ---
+        tags:
+            - tickets
+        security:
+          - BearerAuth: []
+        parameters:
+          - name: Authorization
+            in: header
+            required: true
+            type: string
+            description: JWT token for authorization (e.g., Bearer <token>)
+          - name: format
+            in: query
+            required: false
+            type: string
+            enum: [ndjson, csv]
+            default: ndjson
+            description: Output format
+        produces:
+          - application/x-ndjson
+          - text/csv
+        responses:
+          200:
+            description: Tickets streamed one per line (id, note, status, group, user_id, username)
+          400:
+            description: Unsupported format
+            schema:
+              type: object
+              properties:
+                message:
+                  type: string
+                  description: Error message
+          401:
+            description: Unauthorized (invalid or missing token)
+            schema:
+              type: object
+              properties:
+                message:
+                  type: string
+                  description: Error message
+                  example: Unauthorized
+          500:
+            description: Internal server error
+        """
+        fmt = request.args.get("format", "ndjson")
+        if fmt not in EXPORT_MIMETYPES:
+            return {"message": f"Unsupported format, use one of: {', '.join(EXPORT_MIMETYPES)}"}, 400
+
+        stmt = select(
+            Ticket.id,
+            Ticket.note,
+            Status.name.label("status"),
+            Group.name.label("group"),
+            Ticket.user_id,
+            User.username.label("username"),
+        ).outerjoin(Ticket.status).outerjoin(Ticket.group).outerjoin(Ticket.user).order_by(Ticket.id)
+        # Resolved here, while the request still owns the user object
+        stmt = visible_tickets(stmt, kwargs["user"]).execution_options(
+            yield_per=current_app.config["TICKETS_EXPORT_CHUNK_SIZE"]
+        )
+
+        def generate():
+            # Server-side cursor, one chunk of rows in memory at a time
+            result = db.session.execute(stmt)
+            if fmt == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(EXPORT_FIELDS)
+                for rows in result.partitions():
+                    writer.writerows(rows)
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+                if buffer.tell():
+                    yield buffer.getvalue()
+            else:
+                for rows in result.partitions():
+                    yield "".join(json.dumps(row._asdict()) + "\n" for row in rows)
+
+        return Response(
+            stream_with_context(generate()),
+            mimetype=EXPORT_MIMETYPES[fmt],
+            headers={"Content-Disposition": f"attachment; filename=tickets.{fmt}"},
+        )
 
 
 class TicketDetail(Resource):
     @login_required
+    @replicas.read_only
     def get(self, ticket_id, *args, **kwargs):
         """
         Get ticket by ID
@@ -75,9 +348,14 @@ class TicketDetail(Resource):
             required: true
             type: string
             description: JWT token for authorization (e.g., Bearer <token>)
+          - name: If-None-Match
+            in: header
+            required: false
+            type: string
+            description: ETag of a previously fetched version of the ticket
         responses:
           200:
-            description: Ticket retrieved successfully
+            description: Ticket retrieved successfully, ETag header identifies its version
             schema:
               type: object
               properties:
@@ -97,6 +375,8 @@ class TicketDetail(Resource):
                   type: integer
                   description: ID of the group associated with the ticket
                 # Add other ticket fields here as needed
+          304:
+            description: Ticket unchanged since the ETag given in If-None-Match
           404:
             description: Ticket not found
             schema:
@@ -125,13 +405,25 @@ class TicketDetail(Resource):
                   description: Error message
                   example: Internal server error
         """
+        user = kwargs["user"]
+        if request.if_none_match:
+            # Conditional GET: one narrow query answers both the permission check and the 304
+            row = db.session.execute(
+                select(Ticket.group_id, Ticket.user_id, Ticket.version, User.version)
+                .outerjoin(Ticket.user).where(Ticket.id == ticket_id)
+            ).first()
+            if row is not None and (row[0] in user.group_ids or row[1] == user.id):
+                response = not_modified(make_etag("ticket", (ticket_id, row[2], row[3])))
+                if response:
+                    return response
+
         ticket = get_ticket_by_id(ticket_id)
         if ticket is not None:
-            user = kwargs["user"]
-            if ticket.group not in user.groups and ticket.user != user:
+            if ticket.group_id not in user.group_ids and ticket.user_id != user.id:
                 return {"message": "You are not allowed to see tickets from another groups"}, 403
             else:
-                return ticket_schema.dump(ticket), 200
+                etag = make_etag("ticket", ticket_etag_key(ticket))
+                return ticket_schema.dump(ticket), 200, {"ETag": f'"{etag}"'}
         else:
             return {"message": "Ticket not found"}, 404
 
@@ -204,6 +496,14 @@ class TicketDetail(Resource):
                   type: string
                   description: Error message
                   example: Insufficient permissions
+          409:
+            description: Ticket was changed by another request meanwhile
+            schema:
+              type: object
+              properties:
+                message:
+                  type: string
+                  description: Error message
           500:
             description: Internal server error
             schema:
@@ -223,16 +523,22 @@ class TicketDetail(Resource):
             return {"message": errors}, 400
 
         ticket = get_ticket_by_id(ticket_id)
-        print(user.groups, ticket.group)
-        if ticket.group not in user.groups and ticket.user != user:
+        if ticket.group_id not in user.group_ids and ticket.user_id != user.id:
             return {"message": "You are not allowed to see or modify tickets from another groups"}, 403
 
         ticket.note = note
         ticket.status = status
         ticket.group = group
         ticket.user = assign_to_user
-        db.session.commit()
-        return ticket_schema.dump(ticket), 200
+        try:
+            # Dump before committing, commit expires the ticket and would reload it
+            db.session.flush()
+            body = ticket_schema.dump(ticket)
+            db.session.commit()
+        except StaleDataError:
+            db.session.rollback()
+            return {"message": "Ticket was modified by another request, try again"}, 409
+        return body, 200
 
     # @login_required  # влом
     # @role_required("Manager")
@@ -290,6 +596,14 @@ class TicketDetail(Resource):
                   type: string
                   description: Error message
                   example: Insufficient permissions
+          409:
+            description: Ticket was changed by another request meanwhile
+            schema:
+              type: object
+              properties:
+                message:
+                  type: string
+                  description: Error message
           500:
             description: Internal server error
             schema:
@@ -305,7 +619,11 @@ class TicketDetail(Resource):
             return {"message": "Ticket not found"}, 404
         else:
             db.session.delete(ticket)
-            db.session.commit()
+            try:
+                db.session.commit()
+            except StaleDataError:
+                db.session.rollback()
+                return {"message": "Ticket was modified by another request, try again"}, 409
             return {}, 204
 
 
@@ -464,8 +782,7 @@ class TicketCreate(Resource):
         errors, note, status, group, assign_to_user = validate_ticket(data, user)
         if errors:
             return {"message": errors}, 400
-        print(user.groups, group)
-        if group not in user.groups and "Admin" not in str(user.roles):
+        if group.id not in user.group_ids and not user.is_admin:
             return {"message": "You are not allowed to create tickets for other groups"}, 403
         ticket = Ticket(
             note=note,
@@ -477,3 +794,244 @@ class TicketCreate(Resource):
         db.session.commit()
 
         return ticket_schema.dump(ticket), 201
+
+
+class TicketBulk(Resource):
+    @login_required
+    @role_required("Manager")
+    def post(self, *args, **kwargs):
+        """
+        Create many tickets at once
+        ---
+        tags:
+          - tickets
+        security:
+          - BearerAuth: []
+        parameters:
+          - name: Authorization
+            in: header
+            required: true
+            type: string
+            description: JWT token for authorization (e.g., Bearer <token>)
+          - in: body
+            name: body
+            required: true
+            schema:
+              type: array
+              description: Tickets in the same format as POST /create-ticket
+              items:
+                type: object
+                properties:
+                  note:
+                    type: string
+                  status:
+                    type: string
+                  group:
+                    type: string
+                  user_id:
+                    type: integer
+        responses:
+          201:
+            description: All tickets created
+            schema:
+              type: object
+              properties:
+                created:
+                  type: integer
+                  description: Number of created tickets
+                results:
+                  type: array
+                  description: Per item, in request order, either the new id or the validation errors
+                  items:
+                    type: object
+                    properties:
+                      index:
+                        type: integer
+                      id:
+                        type: integer
+                      errors:
+                        type: object
+          207:
+            description: Some tickets created, see results
+          400:
+            description: Bad request (not an array, too many items or no valid item)
+            schema:
+              type: object
+              properties:
+                message:
+                  type: string
+                  description: Error message
+          401:
+            description: Unauthorized (invalid or missing token)
+            schema:
+              type: object
+              properties:
+                message:
+                  type: string
+                  description: Error message
+                  example: Unauthorized
+          403:
+            description: Forbidden (user does not have required role)
+            schema:
+              type: object
+              properties:
+                message:
+                  type: string
+                  description: Error message
+                  example: Insufficient permissions
+          500:
+            description: Internal server error
+        """
+        items = request.get_json()
+        if not isinstance(items, list) or not items:
+            return {"message": "Expected a non empty array of tickets"}, 400
+        max_items = current_app.config["TICKETS_BULK_MAX_ITEMS"]
+        if len(items) > max_items:
+            return {"message": f"At most {max_items} tickets per request"}, 400
+
+        validated = validate_tickets(items, kwargs["user"])
+        rows = [row for _, row in validated if row is not None]
+        ids = []
+        if rows:
+            # Core INSERT on the table: one executemany (batched by the dialect into multi-row
+            # VALUES with RETURNING in parameter order), no ORM objects and a single commit
+            table = Ticket.__table__
+            ids = db.session.scalars(
+                insert(table).returning(table.c.id, sort_by_parameter_order=True), rows
+            ).all()
+            db.session.commit()
+
+        new_ids = iter(ids)
+        results = [
+            {"index": index, "errors": errors} if row is None else {"index": index, "id": next(new_ids)}
+            for index, (errors, row) in enumerate(validated)
+        ]
+        if not ids:
+            code = 400
+        elif len(ids) < len(items):
+            code = 207
+        else:
+            code = 201
+        return {"created": len(ids), "results": results}, code
+
+    @login_required
+    @role_required("Manager")
+    def patch(self, *args, **kwargs):
+        """
+        Change status, group and/or assignee of many tickets at once
+        ---
+        tags:
+          - tickets
+        security:
+          - BearerAuth: []
+        parameters:
+          - name: Authorization
+            in: header
+            required: true
+            type: string
+            description: JWT token for authorization (e.g., Bearer <token>)
+          - in: body
+            name: body
+            required: true
+            schema:
+              type: object
+              properties:
+                ids:
+                  type: array
+                  description: Tickets to change, either ids or filter is required
+                  items:
+                    type: integer
+                filter:
+                  type: object
+                  description: Tickets to change, matched by current values
+                  properties:
+                    status:
+                      type: string
+                    group:
+                      type: string
+                    assignee:
+                      type: integer
+                changes:
+                  type: object
+                  description: New values, only the given ones are changed
+                  properties:
+                    status:
+                      type: string
+                    group:
+                      type: string
+                    user_id:
+                      type: integer
+        responses:
+          200:
+            description: Tickets updated. Only tickets of the user's groups or assigned to the user are changed
+            schema:
+              type: object
+              properties:
+                updated:
+                  type: integer
+                  description: Number of changed tickets
+          400:
+            description: Bad request (e.g., validation errors)
+            schema:
+              type: object
+              properties:
+                message:
+                  type: object
+                  description: Error messages
+          401:
+            description: Unauthorized (invalid or missing token)
+            schema:
+              type: object
+              properties:
+                message:
+                  type: string
+                  description: Error message
+                  example: Unauthorized
+          403:
+            description: Forbidden (user does not have required role)
+            schema:
+              type: object
+              properties:
+                message:
+                  type: string
+                  description: Error message
+                  example: Insufficient permissions
+          500:
+            description: Internal server error
+        """
+        data = request.get_json()
+        if not isinstance(data, dict):
+            return {"message": {"body": "Expected an object with ids or filter and changes"}}, 400
+
+        # Names and the assignee of the filter resolve like changes do, validated together
+        filter_changes = data.get("filter")
+        if isinstance(filter_changes, dict):
+            filter_changes = {{"assignee": "user_id"}.get(key, key): value for key, value in filter_changes.items()}
+        (errors, values), (filter_errors, current) = validate_ticket_changes(data.get("changes"), filter_changes)
+        criteria = []
+        if "ids" in data:
+            ids = data["ids"]
+            if not isinstance(ids, list) or not ids or not all(is_id(i) for i in ids):
+                errors["ids"] = "Expected a non empty array of ticket ids"
+            elif len(ids) > current_app.config["TICKETS_BULK_MAX_ITEMS"]:
+                errors["ids"] = f"At most {current_app.config['TICKETS_BULK_MAX_ITEMS']} ids per request"
+            else:
+                criteria.append(Ticket.id.in_(ids))
+        elif isinstance(data.get("filter"), dict) and data["filter"]:
+            if filter_errors or data["filter"].keys() - {"status", "group", "assignee"}:
+                errors["filter"] = filter_errors or "Filter by status, group and/or assignee"
+            else:
+                criteria.extend(getattr(Ticket, column) == value for column, value in current.items())
+        else:
+            errors["ids"] = "Either ids or filter is required"
+        if errors:
+            return {"message": errors}, 400
+
+        # Same rule as TicketDetail.put, applied in the WHERE clause of one UPDATE
+        # Bump row versions like ORM updates do, so ETags of changed tickets change too
+        stmt = update(Ticket).where(*criteria, own_tickets(kwargs["user"])).values(
+            version=Ticket.version + 1, **values
+        )
+        result = db.session.execute(stmt.execution_options(synchronize_session=False))
+        db.session.commit()
+        return {"updated": result.rowcount}, 200
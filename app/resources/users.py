@@ -1,16 +1,23 @@
 from flask import request
 from flask_restful import Resource
+from sqlalchemy import select, update
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.exc import StaleDataError
 
 from app import db
-from app.models import User, Role, Group
+from app.cache import reference_cache
+from app.models import User, Role, Group, Ticket
+from app.replicas import replicas
 from app.schemas import user_schema
-from app.utils import get_user_by_id, login_required, role_required, validate_email
+from app.utils import get_user_by_id, get_user_with_relations, login_required, role_required, validate_email, \
+    make_etag, not_modified
 
 
 class UserList(Resource):
 
     @login_required
     @role_required('Manager')
+    @replicas.read_only
     def get(self, *args, **kwargs):
         """
         Get list of users
@@ -25,13 +32,20 @@ class UserList(Resource):
             required: true
             type: string
             description: JWT token for authorization (e.g., Bearer <token>)
+          - name: If-None-Match
+            in: header
+            required: false
+            type: string
+            description: ETag of a previously fetched list
         responses:
           200:
-            description: List of users retrieved successfully
+            description: List of users retrieved successfully, ETag header identifies the content
             schema:
               type: array
               items:
                 schena
+          304:
+            description: List unchanged since the ETag given in If-None-Match
           401:
             description: Unauthorized (invalid or missing token)
             schema:
@@ -60,13 +74,21 @@ class UserList(Resource):
                   description: Error message
                   example: Internal server error
         """
-        users = User.query.all()
-        return user_schema.dump(users, many=True), 200
+        if request.if_none_match:
+            versions = db.session.execute(select(User.id, User.version).order_by(User.id)).all()
+            response = not_modified(make_etag("users", [tuple(row) for row in versions]))
+            if response:
+                return response
+
+        users = User.query.options(selectinload(User.roles), selectinload(User.groups)).order_by(User.id).all()
+        etag = make_etag("users", [(user.id, user.version) for user in users])
+        return user_schema.dump(users, many=True), 200, {"ETag": f'"{etag}"'}
 
 
 class UserDetail(Resource):
     @login_required
     @role_required('Manager')
+    @replicas.read_only
     def get(self, user_id, *args, **kwargs):
         """
         Get user by ID
@@ -86,11 +108,18 @@ class UserDetail(Resource):
             required: true
             type: string
             description: JWT token for authorization (e.g., Bearer <token>)
+          - name: If-None-Match
+            in: header
+            required: false
+            type: string
+            description: ETag of a previously fetched version of the user
         responses:
           200:
-            description: User retrieved successfully
+            description: User retrieved successfully, ETag header identifies its version
             schema:
               $ref: '#/definitions/User'
+          304:
+            description: User unchanged since the ETag given in If-None-Match
           404:
             description: User not found
             schema:
@@ -128,9 +157,17 @@ class UserDetail(Resource):
                   description: Error message
                   example: Internal server error
         """
-        user = get_user_by_id(user_id)
+        if request.if_none_match:
+            version = db.session.execute(select(User.version).where(User.id == user_id)).scalar()
+            if version is not None:
+                response = not_modified(make_etag("user", user_id, version))
+                if response:
+                    return response
+
+        user = get_user_with_relations(user_id)
         if user is not None:
-            return user_schema.dump(user), 200
+            etag = make_etag("user", user.id, user.version)
+            return user_schema.dump(user), 200, {"ETag": f'"{etag}"'}
         return {"message": "User not found"}, 404
 
     @login_required
@@ -226,6 +263,14 @@ class UserDetail(Resource):
                   type: string
                   description: Error message
                   example: Insufficient permissions
+          409:
+            description: User was changed by another request meanwhile
+            schema:
+              type: object
+              properties:
+                message:
+                  type: string
+                  description: Error message
           500:
             description: Internal server error
             schema:
@@ -237,7 +282,8 @@ class UserDetail(Resource):
                   example: Internal server error
           """
         data = request.get_json()
-        user = get_user_by_id(user_id)
+        # Collections loaded up front: replacing them needs the old members, dumping the new ones
+        user = get_user_with_relations(user_id)
         if not user:
             return {"message": "User not found"}, 404
 
@@ -257,19 +303,25 @@ class UserDetail(Resource):
         if errors:
             return {"message": errors}, 400
 
+        # Not existing roles and groups are skipped
         if "roles" in data:
-            user.roles = [Role.query.filter_by(name=role).first() for role in data["roles"]]
-            # To remove consequences possibility after inputting any not existing roles
-            while None in user.roles:
-                user.roles.remove(None)
+            user.roles = reference_cache.get_many(Role, data["roles"])
 
         if "groups" in data:
-            user.groups = [Group.query.filter_by(name=group).first() for group in data["groups"]]
-            # To remove consequences possibility after inputting any not existing groups
-            while None in user.groups:
-                user.groups.remove(None)
-        db.session.commit()
-        return {"message": "Successfully updated", "user": user_schema.dump(user)}, 200
+            user.groups = reference_cache.get_many(Group, data["groups"])
+
+        if "roles" in data or "groups" in data:
+            # Tokens carrying the previous roles/groups are rejected from now on
+            user.authz_version += 1
+        try:
+            # Dump before committing, commit expires the user and would reload it row by row
+            db.session.flush()
+            body = {"message": "Successfully updated", "user": user_schema.dump(user)}
+            db.session.commit()
+        except StaleDataError:
+            db.session.rollback()
+            return {"message": "User was modified by another request, try again"}, 409
+        return body, 200
 
     @login_required
     @role_required('Admin')
@@ -427,6 +479,14 @@ class UserDetail(Resource):
                   type: string
                   description: Error message
                   example: Insufficient permissions
+          409:
+            description: User was changed by another request meanwhile
+            schema:
+              type: object
+              properties:
+                message:
+                  type: string
+                  description: Error message
           500:
             description: Internal server error
             schema:
@@ -441,6 +501,15 @@ class UserDetail(Resource):
         if not user:
             return {"message": "User not found"}, 404
         else:
+            # Unassign the user's tickets in one UPDATE instead of the ORM's one per ticket,
+            # bumping their row versions like ORM updates do
+            db.session.execute(
+                update(Ticket).where(Ticket.user_id == user.id).values(user_id=None, version=Ticket.version + 1)
+            )
             db.session.delete(user)
-            db.session.commit()
+            try:
+                db.session.commit()
+            except StaleDataError:
+                db.session.rollback()
+                return {"message": "User was modified by another request, try again"}, 409
             return {}, 204
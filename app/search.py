@@ -0,0 +1,84 @@
+import re
+from contextlib import contextmanager
+
+from sqlalchemy import DDL, event, func, literal_column, table, column, text
+
+from . import db
+from .models import Ticket
+
+# SQLite: FTS5 table indexing ticket.note (external content, the text itself stays in ticket),
+# kept in sync by triggers so ORM, bulk and raw SQL writes are all covered
+SQLITE_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS ticket_fts USING fts5(note, content='ticket', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS ticket_fts_insert AFTER INSERT ON ticket BEGIN "
+    "INSERT INTO ticket_fts(rowid, note) VALUES (new.id, new.note); END",
+    "CREATE TRIGGER IF NOT EXISTS ticket_fts_delete AFTER DELETE ON ticket BEGIN "
+    "INSERT INTO ticket_fts(ticket_fts, rowid, note) VALUES ('delete', old.id, old.note); END",
+    "CREATE TRIGGER IF NOT EXISTS ticket_fts_update AFTER UPDATE OF note ON ticket BEGIN "
+    "INSERT INTO ticket_fts(ticket_fts, rowid, note) VALUES ('delete', old.id, old.note); "
+    "INSERT INTO ticket_fts(rowid, note) VALUES (new.id, new.note); END",
+)
+SQLITE_TRIGGERS = ("ticket_fts_insert", "ticket_fts_delete", "ticket_fts_update")
+SQLITE_DROP_DDL = (
+    "DROP TABLE IF EXISTS ticket_fts",
+)
+
+# Postgres: generated tsvector column, maintained by the database itself, with a GIN index
+POSTGRES_DDL = (
+    "ALTER TABLE ticket ADD COLUMN IF NOT EXISTS note_tsv tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('english', coalesce(note, ''))) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_ticket_note_tsv ON ticket USING GIN (note_tsv)",
+)
+
+# Database objects created here, hidden from Alembic autogenerate (see migrations/env.py)
+SEARCH_OBJECTS = {"ticket_fts", "note_tsv", "ix_ticket_note_tsv"}
+
+for statement in SQLITE_DDL:
+    event.listen(Ticket.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+for statement in SQLITE_DROP_DDL:
+    event.listen(Ticket.__table__, "before_drop", DDL(statement).execute_if(dialect="sqlite"))
+for statement in POSTGRES_DDL:
+    event.listen(Ticket.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+
+
+
+@contextmanager
+def bulk_load():
+    """
+    Index tickets inserted inside the block in one pass at the end instead of row by row.
+    On SQLite the per-row triggers make a large load several times slower; Postgres maintains
+    its generated column and GIN index as it goes.
+    """
+    if db.session.get_bind().dialect.name != "sqlite":
+        yield
+        return
+    for trigger in SQLITE_TRIGGERS:
+        db.session.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+    yield
+    db.session.execute(text("INSERT INTO ticket_fts(ticket_fts) VALUES ('rebuild')"))
+    for statement in SQLITE_DDL:
+        db.session.execute(text(statement))
+
+
+ticket_fts = table("ticket_fts", column("rowid"), column("rank"))
+
+
+def search_terms(q):
+    """Words of a free text query, operators and punctuation are not passed to the engine"""
+    return re.findall(r"\w+", q or "")
+
+
+def search_tickets(query, terms):
+    """Restrict a ticket query to notes matching all terms, best matches first"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "sqlite":
+        match = " ".join(f'"{term}"' for term in terms)
+        return query.join(ticket_fts, ticket_fts.c.rowid == Ticket.id).filter(
+            literal_column("ticket_fts").op("MATCH")(match)
+        ).order_by(ticket_fts.c.rank, Ticket.id)
+    if dialect == "postgresql":
+        tsquery = func.plainto_tsquery("english", " ".join(terms))
+        tsv = literal_column("ticket.note_tsv")
+        return query.filter(tsv.op("@@")(tsquery)).order_by(func.ts_rank(tsv, tsquery).desc(), Ticket.id)
+    # No text index on other backends, plain (unranked) substring matching
+    return query.filter(*(Ticket.note.contains(term) for term in terms)).order_by(Ticket.id)
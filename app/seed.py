@@ -0,0 +1,119 @@
+import csv
+import io
+import itertools
+import random
+
+from sqlalchemy import insert, select, func, text
+
+from . import db
+from .hashing import password_hasher
+from .models import User, Role, Group, Status, Ticket, user_roles, user_groups
+from .search import bulk_load
+
+STATUSES = ("Pending", "In review", "Closed")
+ROLES = ("Admin", "Manager", "Analyst")
+# Most tickets end up closed, a few wait for review
+STATUS_WEIGHTS = {"Pending": 25, "In review": 15, "Closed": 60}
+ROLE_WEIGHTS = {"Admin": 1, "Manager": 199, "Analyst": 800}
+UNASSIGNED_SHARE = 0.2
+CHUNK = 10000
+WORDS = (
+    "printer", "login", "password", "invoice", "refund", "crash", "slow", "error", "report", "export",
+    "vpn", "email", "access", "account", "billing", "update", "install", "license", "network", "timeout",
+    "screen", "upload", "download", "backup", "sync", "mobile", "browser", "payment", "order", "delivery",
+)
+
+
+def zipf_weights(n, skew):
+    """Cumulative weights of ranks 1..n proportional to 1/rank**skew (0: uniform)"""
+    return list(itertools.accumulate(1 / rank ** skew for rank in range(1, n + 1)))
+
+
+def _insert(table, rows):
+    for start in range(0, len(rows), CHUNK):
+        db.session.execute(insert(table), rows[start:start + CHUNK])
+
+
+def _copy(table, columns, rows):
+    """Postgres COPY FROM STDIN of the rows, through the session's connection (same transaction)"""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert(f'COPY {table.name} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)', buffer)
+
+
+def _ensure_names(model, names):
+    existing = set(db.session.scalars(select(model.name)))
+    _insert(model.__table__, [{"name": name} for name in names if name not in existing])
+    return dict(db.session.execute(select(model.name, model.id)).all())
+
+
+def seed_bulk(groups, users, tickets, skew=1.0, groups_per_user=3, password="password", rng=None, log=print):
+    """
+    Append synthetic groups, users (sharing one pre-computed password hash), memberships and tickets.
+
+    Group sizes and ticket counts per group and per user follow a Zipf-like distribution of exponent
+    `skew`, as do status and role shares, so a few groups and users dominate like in real data.
+    Rows go in with executemany batches, tickets with COPY on Postgres.
+    """
+    rng = rng or random.Random(0)
+    statuses = _ensure_names(Status, STATUSES)
+    roles = _ensure_names(Role, ROLES)
+
+    offset = db.session.scalar(select(func.coalesce(func.max(Group.id), 0)))
+    _insert(Group.__table__, [{"name": f"Group{offset + i}"} for i in range(1, groups + 1)])
+    group_ids = db.session.scalars(select(Group.id).where(Group.id > offset).order_by(Group.id)).all()
+    log(f"{len(group_ids)} groups")
+
+    pwhash = password_hasher.hash(password)
+    offset = db.session.scalar(select(func.coalesce(func.max(User.id), 0)))
+    _insert(User.__table__, [
+        {"username": f"user{offset + i}", "email": f"user{offset + i}@example.com", "password": pwhash}
+        for i in range(1, users + 1)
+    ])
+    user_ids = db.session.scalars(select(User.id).where(User.id > offset).order_by(User.id)).all()
+
+    role_names = list(ROLE_WEIGHTS)
+    _insert(user_roles, [
+        {"user_id": user_id, "role_id": roles[role]}
+        for user_id, role in zip(user_ids, rng.choices(role_names, list(ROLE_WEIGHTS.values()), k=len(user_ids)))
+    ])
+    group_weights = zipf_weights(len(group_ids), skew) if group_ids else []
+    members = {group_id: [] for group_id in group_ids}
+    memberships = []
+    for user_id in user_ids:
+        for group_id in set(rng.choices(group_ids, cum_weights=group_weights, k=rng.randint(1, groups_per_user))):
+            members[group_id].append(user_id)
+            memberships.append({"user_id": user_id, "group_id": group_id})
+    _insert(user_groups, memberships)
+    log(f"{len(user_ids)} users, {len(memberships)} group memberships")
+
+    if tickets and group_ids:
+        # Within a group, members are ranked by the same Zipf law: a few handle most of its tickets
+        member_weights = {group_id: zipf_weights(len(ids), skew) for group_id, ids in members.items() if ids}
+        status_ids = [statuses[name] for name in STATUS_WEIGHTS]
+        postgres = db.session.get_bind().dialect.name == "postgresql"
+        columns = ("note", "status_id", "group_id", "user_id")
+        with bulk_load():
+            for start in range(0, tickets, CHUNK * 10):
+                count = min(CHUNK * 10, tickets - start)
+                rows = []
+                for group_id, status_id in zip(
+                    rng.choices(group_ids, cum_weights=group_weights, k=count),
+                    rng.choices(status_ids, list(STATUS_WEIGHTS.values()), k=count),
+                ):
+                    user_id = None
+                    if group_id in member_weights and rng.random() >= UNASSIGNED_SHARE:
+                        user_id = rng.choices(members[group_id], cum_weights=member_weights[group_id])[0]
+                    rows.append((" ".join(rng.choices(WORDS, k=rng.randint(3, 12))), status_id, group_id, user_id))
+                if postgres:
+                    _copy(Ticket.__table__, columns, rows)
+                else:
+                    _insert(Ticket.__table__, [dict(zip(columns, row)) for row in rows])
+                log(f"{start + count} tickets")
+
+    db.session.commit()
+    # Fresh planner statistics, the row counts changed by orders of magnitude
+    db.session.execute(text("ANALYZE"))
+    db.session.commit()
@@ -0,0 +1,75 @@
+import glob
+import os
+
+from gunicorn.app.base import BaseApplication
+
+from . import db, metrics
+
+
+def server_options(app, **overrides):
+    """gunicorn settings from the app config, overrides (e.g. command line options) win"""
+    config = app.config
+    options = {
+        "bind": f'{config["SERVER_HOST"]}:{config["SERVER_PORT"]}',
+        "workers": config["SERVER_WORKERS"],
+        "threads": config["SERVER_THREADS"],
+        # Import the app once in the master, workers share the loaded code copy-on-write
+        "preload_app": True,
+        # Recycle workers after a jittered number of requests, bounds slow leaks and fragmentation
+        "max_requests": config["SERVER_MAX_REQUESTS"],
+        "max_requests_jitter": config["SERVER_MAX_REQUESTS_JITTER"],
+        "timeout": config["SERVER_TIMEOUT"],
+        # Time in-flight requests get to finish on HUP/TERM before workers are killed
+        "graceful_timeout": config["SERVER_GRACEFUL_TIMEOUT"],
+        "keepalive": config["SERVER_KEEPALIVE"],
+        "accesslog": "-",
+        "post_fork": post_fork,
+        "child_exit": child_exit,
+    }
+    options.update((key, value) for key, value in overrides.items() if value is not None)
+    return options
+
+
+def post_fork(server, worker):
+    # Connections opened in the master before forking must not be shared by the workers
+    with server.app.application.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def child_exit(server, worker):
+    metrics.mark_process_dead(worker.pid)
+
+
+def clear_metrics_dir():
+    # Files of a previous run would be aggregated with this one's
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        for path in glob.glob(os.path.join(directory, "*.db")):
+            os.remove(path)
+
+
+class Server(BaseApplication):
+    """Pre-forking gunicorn server running an already created app"""
+
+    def __init__(self, application, options=None):
+        self.application = application
+        self.options = options or {}
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+def serve(app, **overrides):
+    clear_metrics_dir()
+    with app.app_context():
+        # Build the spec in the master, so workers inherit it instead of each generating it
+        from .spec import get_spec
+        get_spec()
+    Server(app, server_options(app, **overrides)).run()
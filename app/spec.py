@@ -0,0 +1,73 @@
+import hashlib
+import json
+import threading
+
+from flask import current_app
+from flask_swagger import swagger
+
+SPEC_TITLE = "My API"
+SPEC_VERSION = "1.0"
+# Vendor extension carrying the route fingerprint, lets a prebuilt artifact be checked for staleness
+FINGERPRINT_KEY = "x-routes-fingerprint"
+
+_lock = threading.Lock()
+
+
+def routes_fingerprint(app):
+    """Digest of the routes, their methods and view docstrings, i.e. of everything the spec is built from"""
+    digest = hashlib.blake2b(digest_size=16)
+    for rule in sorted(app.url_map.iter_rules(), key=lambda r: (r.rule, r.endpoint)):
+        view = app.view_functions.get(rule.endpoint)
+        view = getattr(view, "view_class", view)
+        docs = [getattr(view, "__doc__", None) or ""]
+        docs += [getattr(getattr(view, m.lower(), None), "__doc__", None) or "" for m in sorted(rule.methods)]
+        digest.update(repr((rule.rule, rule.endpoint, sorted(rule.methods), docs)).encode())
+    return digest.hexdigest()
+
+
+def build_spec(app):
+    """Introspect the routes and parse the resource docstrings, the expensive part"""
+    swag = swagger(app)
+    swag['info']['version'] = SPEC_VERSION
+    swag['info']['title'] = SPEC_TITLE
+    swag[FINGERPRINT_KEY] = routes_fingerprint(app)
+    return swag
+
+
+def load_spec_file(path, fingerprint):
+    """Prebuilt spec from `manage.py spec`, None when missing or built for a different route set"""
+    try:
+        with open(path, "rb") as f:
+            body = f.read()
+        swag = json.loads(body)
+    except (OSError, ValueError):
+        return None
+    if swag.get(FINGERPRINT_KEY) != fingerprint:
+        return None
+    return body
+
+
+def get_spec():
+    """
+    Serialized spec and its ETag, built once per process.
+
+    SWAGGER_SPEC_FILE, when set and up to date, is served as is; otherwise the spec is
+    generated from the routes on first use. Either way the result is keyed by the route
+    fingerprint, so a changed resource set is never served a stale spec.
+    """
+    app = current_app._get_current_object()
+    cached = app.extensions.get("spec")
+    if cached is not None:
+        return cached
+    with _lock:
+        cached = app.extensions.get("spec")
+        if cached is None:
+            fingerprint = routes_fingerprint(app)
+            body = None
+            if app.config.get("SWAGGER_SPEC_FILE"):
+                body = load_spec_file(app.config["SWAGGER_SPEC_FILE"], fingerprint)
+            if body is None:
+                body = json.dumps(build_spec(app), sort_keys=True).encode()
+            etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+            cached = app.extensions["spec"] = (body, etag)
+    return cached
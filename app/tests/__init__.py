@@ -1,4 +1,8 @@
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
 import pytest
+from sqlalchemy import event
 from werkzeug.security import generate_password_hash
 
 from app import create_app, db
@@ -118,3 +122,98 @@ def get_header(un, pwd, client):
         raise KeyError("Wrong credentials are passed to get_header() in tests")
     else:
         return {'Authorization': token}
+
+
+@contextmanager
+def count_queries():
+    """Collect SQL statements sent to the database inside the block"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+
+
+def add_tickets(n):
+    statuses = Status.query.all()
+    groups = Group.query.all()
+    users = User.query.all()
+    for i in range(n):
+        db.session.add(Ticket(
+            note=f"Extra ticket {i}",
+            status=statuses[i % len(statuses)],
+            group=groups[i % len(groups)],
+            user=users[i % len(users)],
+        ))
+    db.session.commit()
+
+
+def add_users(n):
+    groups = Group.query.all()
+    roles = Role.query.all()
+    start = User.query.count()
+    for i in range(start, start + n):
+        db.session.add(User(
+            username=f"extrauser{i}",
+            email=f"extra{i}@example.com",
+            password="not a hash",
+            roles=[roles[i % len(roles)]],
+            groups=groups[:i % len(groups) + 1],
+        ))
+    db.session.commit()
+
+
+# Most SQL statements (reads and writes) a warm request may issue, per (method, route).
+# Every API route needs an entry, see test_query_budgets.py.
+QUERY_BUDGETS = {
+    ("GET", "/register"): 0,
+    ("POST", "/register"): 3,
+    ("POST", "/login"): 1,
+    ("GET", "/profile"): 3,
+    ("GET", "/users"): 3,
+    ("GET", "/users/<int:user_id>"): 3,
+    ("PUT", "/users/<int:user_id>"): 9,
+    ("PATCH", "/users/<int:user_id>"): 9,
+    ("DELETE", "/users/<int:user_id>"): 8,
+    ("GET", "/tickets"): 1,
+    ("GET", "/tickets/<int:ticket_id>"): 1,
+    ("PUT", "/tickets/<int:ticket_id>"): 2,
+    ("DELETE", "/tickets/<int:ticket_id>"): 2,
+    ("GET", "/tickets/export"): 1,
+    ("POST", "/tickets/bulk"): 2,
+    ("PATCH", "/tickets/bulk"): 1,
+    ("GET", "/tickets/search"): 1,
+    ("GET", "/create-ticket"): 0,
+    ("POST", "/create-ticket"): 4,
+    ("GET", "/admin/pool"): 0,
+}
+
+
+def request_within_budget(client, method, url, **kwargs):
+    """
+    Issue a test client request, failing when it runs more statements than QUERY_BUDGETS allows
+    for its route. The session is emptied first, so objects loaded earlier by the test cannot
+    hide lazy loads. Returns the response and the statements.
+    """
+    adapter = client.application.url_map.bind("localhost")
+    rule, _ = adapter.match(urlsplit(url).path, method, return_rule=True)
+    budget = QUERY_BUDGETS[(method, rule.rule)]
+
+    db.session.expunge_all()
+    with count_queries() as statements:
+        response = client.open(url, method=method, **kwargs)
+        response.get_data()  # streamed bodies run their queries while being consumed
+    counted = statements
+    if db.engine.dialect.name == "sqlite":
+        # SQLite cannot batch INSERT .. RETURNING with ordered ids, SQLAlchemy sends one per row
+        counted = [s for i, s in enumerate(statements)
+                   if not (i and s == statements[i - 1] and s.startswith("INSERT") and "RETURNING" in s)]
+    assert len(counted) <= budget, (
+        f"{method} {rule.rule} ran {len(counted)} statements, budget {budget}:\n" + "\n".join(counted)
+    )
+    return response, counted
@@ -0,0 +1,19 @@
+from app import db
+from app.pool import MeteredQueuePool
+from . import app, client, init_database  # noqa
+from . import get_header
+
+
+def test_pool_stats(client, init_database):
+    assert isinstance(db.engine.pool, MeteredQueuePool)
+    header = get_header("testadmin1", "12345", client)
+    response = client.get('/admin/pool', headers=header)
+    assert response.status_code == 200
+    stats = response.json["engines"]["default"]
+    assert stats["size"] == 5
+    assert stats["checkouts"] >= 1
+    assert stats["connects"] >= 1
+    assert stats["wait_seconds_max"] >= 0
+
+    header = get_header("testuser2", "54321", client)
+    assert client.get('/admin/pool', headers=header).status_code == 403
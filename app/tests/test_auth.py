@@ -1,6 +1,9 @@
+from app import db
+from app.hashing import password_hasher
 from app.models import User
+from app.utils import decode_token
 from . import app, client, init_database  # noqa
-from . import get_header
+from . import get_header, count_queries
 
 
 def test_register(client, init_database):
@@ -42,3 +45,112 @@ def test_profile(client, init_database):
     assert "email" in response.json
     assert "groups" in response.json
     assert "roles" in response.json
+
+
+def test_login_embeds_authz_claims(app, client, init_database):
+    app.config["JWT_EMBED_AUTHZ"] = True
+    header = get_header("testuser3", "51423", client)
+    payload = decode_token(header["Authorization"])
+    assert payload["roles"] == ["Analyst"]
+    assert payload["ver"] == 1
+
+    # Only the authz_version lookup, cached afterwards
+    with count_queries() as statements:
+        assert client.get('/tickets', headers=header).status_code == 200
+        assert client.get('/tickets', headers=header).status_code == 200
+    assert len([s for s in statements if s.startswith("SELECT user.authz_version")]) == 1
+    assert not [s for s in statements if "user_roles" in s or "user_groups" in s]
+
+
+def test_outdated_authz_claims_rejected(app, client, init_database):
+    app.config["JWT_EMBED_AUTHZ"] = True
+    analyst = get_header("testuser3", "51423", client)
+    assert client.get('/tickets', headers=analyst).status_code == 200
+
+    admin = get_header("testadmin1", "12345", client)
+    user = User.query.filter_by(username="testuser3").first()
+    response = client.put(f'/users/{user.id}', headers=admin, json={"groups": ["Customer1"]})
+    assert response.status_code == 200
+
+    response = client.get('/tickets', headers=analyst)
+    assert response.status_code == 401
+    assert "outdated" in response.json["message"]
+    analyst = get_header("testuser3", "51423", client)
+    assert client.get('/tickets', headers=analyst).status_code == 200
+
+
+def test_login_rehashes_outdated_password(app, client, init_database):
+    app.config["PASSWORD_HASH_METHOD"] = "bcrypt:4"
+    password_hasher.init_app(app)
+    user = User.query.filter_by(username="testuser2").first()
+    assert user.password.startswith("scrypt:")
+
+    assert client.post('/login', json={"username": "testuser2", "password": "54321"}).status_code == 200
+    db.session.refresh(user)
+    assert user.password.startswith("$2b$04$")
+    rehashed = user.password
+
+    # Up to date now, further logins leave the hash alone
+    assert client.post('/login', json={"username": "testuser2", "password": "54321"}).status_code == 200
+    assert client.post('/login', json={"username": "testuser2", "password": "wrong"}).status_code == 401
+    db.session.refresh(user)
+    assert user.password == rehashed
+
+
+def test_hashing_inline_and_pooled(app):
+    for workers in (0, 1):
+        app.config.update(PASSWORD_HASH_WORKERS=workers, PASSWORD_HASH_METHOD="pbkdf2:sha256:1000")
+        password_hasher.init_app(app)
+        pwhash = password_hasher.hash("secret")
+        assert pwhash.startswith("pbkdf2:sha256:1000$")
+        assert password_hasher.check(pwhash, "secret")
+        assert not password_hasher.check(pwhash, "other")
+        assert not password_hasher.needs_rehash(pwhash)
+
+
+def test_hashing_saturated(app, client, init_database):
+    app.config["PASSWORD_HASH_MAX_PENDING"] = 0
+    password_hasher.init_app(app)
+    response = client.post('/login', json={"username": "testuser2", "password": "54321"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_login_throttled_per_username(app, client, init_database):
+    app.config.update(RATELIMIT_USERNAME_BURST=3, RATELIMIT_PROXY_HOPS=1)
+    owner, attacker = {"X-Forwarded-For": "10.0.0.1"}, {"X-Forwarded-For": "10.0.0.2"}
+    assert client.post('/login', json={"username": "testuser2", "password": "54321"}, headers=owner).status_code == 200
+    for _ in range(3):
+        response = client.post('/login', json={"username": "testuser2", "password": "wrong"}, headers=attacker)
+        assert response.status_code == 401
+
+    # Rejected before any query or hash, even with the right password
+    with count_queries() as statements:
+        response = client.post('/login', json={"username": "testuser2", "password": "54321"}, headers=attacker)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+    assert statements == []
+
+    # The owner's IP is not locked out
+    assert client.post('/login', json={"username": "testuser2", "password": "54321"}, headers=owner).status_code == 200
+
+    # Other accounts are unaffected, successful logins cost nothing
+    for _ in range(5):
+        assert client.post('/login', json={"username": "testuser3", "password": "51423"}).status_code == 200
+
+
+def test_login_throttled_per_ip(app, client, init_database):
+    # No refill while the test runs, however slow
+    app.config.update(RATELIMIT_IP_BURST=2, RATELIMIT_IP_RATE=1e-6, RATELIMIT_PROXY_HOPS=1)
+    for _ in range(2):
+        response = client.post('/login', json={"username": "testuser3", "password": "51423"},
+                               headers={"X-Forwarded-For": "10.0.0.1"})
+        assert response.status_code == 200
+    response = client.post('/login', json={"username": "testuser3", "password": "51423"},
+                           headers={"X-Forwarded-For": "10.0.0.1"})
+    assert response.status_code == 429
+    response = client.post('/register', json={}, headers={"X-Forwarded-For": "10.0.0.2"})
+    assert response.status_code != 429
+    response = client.post('/login', json={"username": "testuser3", "password": "51423"},
+                           headers={"X-Forwarded-For": "10.0.0.2"})
+    assert response.status_code == 200
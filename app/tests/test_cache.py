@@ -0,0 +1,96 @@
+from app.cache import reference_cache
+from app.models import Group, Status, User
+from . import app, client, init_database, db  # noqa
+from . import get_header, count_queries
+
+TICKET = {"note": "Cached lookups", "status": "Pending", "group": "Customer2", "user_id": ""}
+
+
+def test_reference_cache_skips_lookup_queries(client, init_database):
+    header = get_header("testuser2", "54321", client)
+    response = client.post('/create-ticket', headers=header, json=TICKET)
+    assert response.status_code == 201
+
+    with count_queries() as statements:
+        response = client.post('/create-ticket', headers=header, json=TICKET)
+    assert response.status_code == 201
+    assert not [s for s in statements if "status.name = ?" in s or '"group".name = ?' in s]
+
+
+def test_reference_cache_invalidated_on_commit(client, init_database):
+    assert reference_cache.get(Group, "Customer4") is None
+
+    db.session.add(Group(name="Customer4"))
+    db.session.commit()
+    assert reference_cache.get(Group, "Customer4").name == "Customer4"
+
+    status = Status.query.filter_by(name="Closed").first()
+    status.name = "Done"
+    db.session.commit()
+    assert reference_cache.get(Status, "Closed") is None
+    assert reference_cache.get(Status, "Done").id == status.id
+
+
+def test_reference_cache_get_many_skips_unknown(client, init_database):
+    groups = reference_cache.get_many(Group, ["Customer1", "Nope", "Customer3"])
+    assert [g.name for g in groups] == ["Customer1", "Customer3"]
+
+
+def insert_elsewhere(model, name):
+    """Row written without this process noticing (another worker, a script)"""
+    with db.engine.begin() as connection:
+        connection.execute(model.__table__.insert().values(name=name))
+
+
+def test_reference_cache_reloads_on_unknown_name(app, client, init_database):
+    header = get_header("testuser2", "54321", client)
+    assert reference_cache.get(Status, "Pending") is not None
+    insert_elsewhere(Status, "Escalated")
+    insert_elsewhere(Group, "Customer4")
+
+    # Right after a load a miss is trusted
+    assert reference_cache.get(Status, "Escalated") is None
+    app.config["REFERENCE_CACHE_MISS_RELOAD"] = 0
+    response = client.post('/create-ticket', headers=header, json={**TICKET, "status": "Escalated"})
+    assert response.status_code == 201
+    groups = reference_cache.get_many(Group, ["Customer2", "Customer4"])
+    assert [g.name for g in groups] == ["Customer2", "Customer4"]
+
+
+def test_reference_cache_expires(app, client, init_database):
+    assert reference_cache.get(Group, "Customer1") is not None
+    with db.engine.begin() as connection:
+        connection.execute(Group.__table__.update().where(Group.name == "Customer1").values(name="Renamed"))
+    assert reference_cache.get(Group, "Customer1") is not None
+    app.config["REFERENCE_CACHE_TTL"] = 0
+    assert reference_cache.get(Group, "Customer1") is None
+
+
+def test_principal_cached_between_requests(client, init_database):
+    header = get_header("testuser3", "51423", client)
+    client.get('/tickets', headers=header)
+    with count_queries() as statements:
+        response = client.get('/tickets', headers=header)
+    assert response.status_code == 200
+    assert not [s for s in statements if "FROM user" in s or "user_roles" in s or "user_groups" in s]
+
+
+def test_principal_invalidated_on_user_update(client, init_database):
+    analyst = get_header("testuser3", "51423", client)
+    assert client.get('/users', headers=analyst).status_code == 403
+
+    admin = get_header("testadmin1", "12345", client)
+    user = User.query.filter_by(username="testuser3").first()
+    response = client.put(f'/users/{user.id}', headers=admin, json={"roles": ["Manager"]})
+    assert response.status_code == 200
+    assert client.get('/users', headers=analyst).status_code == 200
+
+
+def test_principal_invalidated_on_user_delete(client, init_database):
+    header = get_header("testuser3", "51423", client)
+    assert client.get('/tickets', headers=header).status_code == 200
+
+    admin = get_header("testadmin1", "12345", client)
+    user = User.query.filter_by(username="testuser3").first()
+    assert client.delete(f'/users/{user.id}', headers=admin).status_code == 204
+    assert client.get('/tickets', headers=header).status_code == 404
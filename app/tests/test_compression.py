@@ -0,0 +1,95 @@
+import gzip
+import json
+
+import pytest
+from flask import current_app
+
+from . import app, client, init_database  # noqa
+from . import add_tickets, get_header
+
+
+def test_gzip_ticket_list(client, init_database):
+    add_tickets(20)
+    header = get_header("testadmin1", "12345", client)
+    plain = client.get('/tickets', headers=header)
+    assert "Content-Encoding" not in plain.headers
+    assert plain.headers["Vary"] == "Accept-Encoding"
+
+    response = client.get('/tickets', headers={**header, "Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert int(response.headers["Content-Length"]) == len(response.data) < len(plain.data)
+    assert json.loads(gzip.decompress(response.data)) == plain.json
+
+    # The compressed variant has its own ETag, which revalidates as well
+    assert response.headers["ETag"] == plain.headers["ETag"][:-1] + '-gzip"'
+    revalidated = client.get('/tickets', headers={**header, "Accept-Encoding": "gzip",
+                                                  "If-None-Match": response.headers["ETag"]})
+    assert revalidated.status_code == 304
+    assert revalidated.headers["ETag"] == response.headers["ETag"]
+
+
+def test_negotiation(client, init_database):
+    add_tickets(20)
+    header = get_header("testadmin1", "12345", client)
+    response = client.get('/tickets', headers={**header, "Accept-Encoding": "gzip;q=0, identity"})
+    assert "Content-Encoding" not in response.headers
+    response = client.get('/tickets', headers={**header, "Accept-Encoding": "deflate, gzip;q=0.5"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    # Small bodies are not worth it
+    response = client.get('/profile', headers={**header, "Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+
+
+@pytest.mark.parametrize("encoding, module", [("br", "brotli"), ("zstd", "zstandard")])
+def test_optional_encodings(client, init_database, encoding, module):
+    codec = pytest.importorskip(module)
+    add_tickets(20)
+    header = get_header("testadmin1", "12345", client)
+    plain = client.get('/tickets', headers=header)
+    response = client.get('/tickets', headers={**header, "Accept-Encoding": f"gzip, {encoding}"})
+    # Preferred over gzip, the client ranks them equally
+    assert response.headers["Content-Encoding"] == encoding
+    data = codec.ZstdDecompressor().decompressobj().decompress(response.data) if module == "zstandard" \
+        else codec.decompress(response.data)
+    assert json.loads(data) == plain.json
+
+
+def test_compressed_variants_cached(client, init_database, monkeypatch):
+    add_tickets(20)
+    header = {**get_header("testadmin1", "12345", client), "Accept-Encoding": "gzip"}
+    encoder = current_app.extensions["compression"]["encoders"]["gzip"]
+    calls = []
+    compress = encoder.compress
+    monkeypatch.setattr(encoder, "compress", lambda data: calls.append(data) or compress(data))
+
+    first = client.get('/tickets', headers=header)
+    second = client.get('/tickets', headers=header)
+    assert first.data == second.data
+    assert len(calls) == 1
+    # Another page is another ETag
+    client.get('/tickets?limit=10', headers=header)
+    assert len(calls) == 2
+
+
+def test_streamed_export(client, init_database):
+    add_tickets(20)
+    header = get_header("testadmin1", "12345", client)
+    # Read before the next request, requests of the test client share the app context
+    plain = client.get('/tickets/export?format=csv', headers=header).data
+    response = client.get('/tickets/export?format=csv', headers={**header, "Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+    assert gzip.decompress(response.data) == plain
+
+
+def test_variants_of_other_pages_not_shared(client, init_database):
+    add_tickets(20)
+    header = {**get_header("testadmin1", "12345", client), "Accept-Encoding": "gzip"}
+    by_id = client.get('/tickets?limit=10', headers=header)
+    by_status = client.get('/tickets?limit=10&sort=status', headers=header)
+    assert by_id.headers["ETag"] != by_status.headers["ETag"]
+    page = json.loads(gzip.decompress(by_status.data))
+    assert [t["status"]["id"] for t in page["tickets"]] == sorted(t["status"]["id"] for t in page["tickets"])
+
+    response = client.get(f'/tickets?limit=10&sort=status&cursor={page["next_cursor"]}', headers=header)
+    assert response.status_code == 200
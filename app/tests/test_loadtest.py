@@ -0,0 +1,26 @@
+import pytest
+
+from app.loadtest import format_report, parse_mix, percentile
+
+
+def test_parse_mix():
+    assert parse_mix("list=50, detail=30,create") == {"list": 50.0, "detail": 30.0, "create": 1.0}
+    with pytest.raises(ValueError):
+        parse_mix("list=50,delete=10")
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 51
+    assert percentile(values, 99) == 100
+    assert percentile([], 50) is None
+
+
+def test_format_report():
+    stats = {"requests": 10, "errors": 1, "error_rate": 0.1, "throughput_rps": 5.0,
+             "p50_ms": 1.0, "p95_ms": 2.0, "p99_ms": 3.0, "max_ms": 3.0}
+    empty = dict(stats, requests=0)
+    report = format_report({"endpoints": {"list": stats, "create": empty}, "total": stats})
+    lines = report.splitlines()
+    assert len(lines) == 3
+    assert lines[1].split() == ["list", "10", "10.0%", "5.0", "1.0", "2.0", "3.0"]
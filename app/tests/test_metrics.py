@@ -0,0 +1,55 @@
+import time
+
+from prometheus_client import REGISTRY
+
+from app import create_app, metrics
+from . import app, client, init_database  # noqa
+from . import Config, get_header
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_request_metrics(client, init_database):
+    header = get_header("testadmin1", "12345", client)
+    labels = {"endpoint": "/tickets", "method": "GET"}
+    count = sample("http_request_duration_seconds_count", **labels)
+    ok = sample("http_requests_total", status="200", **labels)
+    statements = sample("http_request_sql_statements_sum", **labels)
+
+    assert client.get('/tickets', headers=header).status_code == 200
+    assert client.get('/tickets/999999', headers=header).status_code == 404
+    assert client.delete('/metrics').status_code == 405
+
+    assert sample("http_request_duration_seconds_count", **labels) == count + 1
+    assert sample("http_requests_total", status="200", **labels) == ok + 1
+    assert sample("http_request_sql_statements_sum", **labels) > statements
+    assert sample("http_requests_total", endpoint="/tickets/<int:ticket_id>", method="GET", status="404") >= 1
+    assert sample("http_requests_total", endpoint=metrics.UNMATCHED, method="DELETE", status="405") >= 1
+    assert sample("http_requests_in_progress") == 0
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    assert b'http_request_duration_seconds_bucket{endpoint="/tickets",' in response.data
+
+
+def test_instrumentation_overhead(app):
+    class Uninstrumented(Config):
+        METRICS_ENABLED = False
+
+    def best_of(client, repeat=5, rounds=200):
+        client.get('/spec')
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for _ in range(rounds):
+                client.get('/spec')
+            timings.append(time.perf_counter() - started)
+        return min(timings)
+
+    # Relative to the same requests without metrics, a slow or busy machine slows down both
+    instrumented = best_of(app.test_client())
+    uninstrumented = best_of(create_app(Uninstrumented).test_client())
+    assert instrumented < uninstrumented * 1.5
@@ -0,0 +1,96 @@
+import pytest
+from flask_restful import Resource
+
+from app.cache import reference_cache
+from app.models import Group, Role, Status, Ticket, User
+from . import app, client, init_database, db  # noqa
+from . import get_header, add_tickets, add_users, request_within_budget, QUERY_BUDGETS
+
+TICKET = {"note": "Budget", "status": "Pending", "group": "Customer1", "user_id": ""}
+
+
+def api_routes(app):
+    for rule in app.url_map.iter_rules():
+        view = getattr(app.view_functions[rule.endpoint], "view_class", None)
+        if view is not None and issubclass(view, Resource):
+            for method in rule.methods - {"HEAD", "OPTIONS"}:
+                yield method, rule.rule
+
+
+def test_every_route_has_a_budget(app):
+    missing = set(api_routes(app)) - set(QUERY_BUDGETS)
+    assert not missing, f"Declare query budgets in app/tests/__init__.py for {sorted(missing)}"
+
+
+def requests(client):
+    """(method, url, kwargs) of a call per endpoint, against the fixture rows"""
+    user_id = User.query.filter_by(username="testuser3").first().id
+    ticket_id = Ticket.query.filter_by(note="Ticket 2").first().id
+    return [
+        ("GET", "/profile", {}),
+        ("GET", "/users", {}),
+        ("GET", f"/users/{user_id}", {}),
+        ("PUT", f"/users/{user_id}", {"json": {"roles": ["Manager", "Analyst"], "groups": ["Customer1"]}}),
+        ("PATCH", f"/users/{user_id}", {"json": {"groups": ["Customer2", "Customer3"]}}),
+        ("GET", "/tickets", {}),
+        ("GET", "/tickets?status=Pending&sort=-status", {}),
+        ("GET", f"/tickets/{ticket_id}", {}),
+        ("PUT", f"/tickets/{ticket_id}", {"json": {**TICKET, "note": "Ticket 2", "status": "Closed"}}),
+        ("GET", "/tickets/search?q=ticket", {}),
+        ("GET", "/tickets/export", {}),
+        ("GET", "/tickets/export?format=csv", {}),
+        ("POST", "/create-ticket", {"json": TICKET}),
+        ("POST", "/tickets/bulk", {"json": [TICKET] * 20}),
+        ("PATCH", "/tickets/bulk", {"json": {"filter": {"status": "Closed"}, "changes": {"status": "In review"}}}),
+    ]
+
+
+def warm_caches(client, header):
+    client.get('/profile', headers=header)
+    for model in (Status, Group, Role):
+        reference_cache.ids(model)
+
+
+@pytest.mark.parametrize("size", [5, 50])
+def test_query_budgets(client, init_database, size):
+    add_users(size)
+    add_tickets(size)
+    header = get_header("testadmin1", "12345", client)
+    warm_caches(client, header)
+    for method, url, kwargs in requests(client):
+        response, _ = request_within_budget(client, method, url, headers=header, **kwargs)
+        assert response.status_code < 300, (method, url, response.json)
+
+
+def test_query_counts_constant_as_data_grows(client, init_database):
+    header = get_header("testadmin1", "12345", client)
+    warm_caches(client, header)
+    # A first pass brings the rows to the state the writes leave them in, so passes are comparable
+    for method, url, kwargs in requests(client):
+        client.open(url, method=method, headers=header, **kwargs)
+    counts = []
+    for size in (0, 10, 100):
+        add_users(size)
+        add_tickets(size)
+        counts.append({
+            (method, url): len(request_within_budget(client, method, url, headers=header, **kwargs)[1])
+            for method, url, kwargs in requests(client)
+        })
+    assert counts[0] == counts[1] == counts[2]
+
+
+def test_credential_and_delete_budgets(client, init_database):
+    data = {"username": "budget", "email": "budget@example.com", "password": "pw", "confirm_password": "pw"}
+    request_within_budget(client, "POST", "/register", json=data)
+    response, _ = request_within_budget(client, "POST", "/login", json={"username": "budget", "password": "pw"})
+    assert response.status_code == 200
+
+    header = get_header("testadmin1", "12345", client)
+    warm_caches(client, header)
+    add_tickets(20)
+    ticket_id = Ticket.query.filter_by(note="Ticket 2").first().id
+    response, _ = request_within_budget(client, "DELETE", f"/tickets/{ticket_id}", headers=header)
+    assert response.status_code < 300
+    user_id = User.query.filter_by(username="budget").first().id
+    response, _ = request_within_budget(client, "DELETE", f"/users/{user_id}", headers=header)
+    assert response.status_code < 300
@@ -0,0 +1,85 @@
+import time
+
+import pytest
+from flask import current_app
+
+from app import create_app, db
+from app.models import Ticket
+from app.replicas import MemoryStickyStore
+from . import client, init_database  # noqa
+from . import Config, get_header
+
+
+class ReplicaConfig(Config):
+    SQLALCHEMY_REPLICA_URIS = ['sqlite:///ticketsystem_test_replica.db']
+
+
+@pytest.fixture
+def app():
+    app = create_app(ReplicaConfig)
+    with app.app_context():
+        replica = db.engines["replica0"]
+        db.create_all()
+        db.metadata.create_all(replica)
+        yield app
+        db.session.remove()
+        db.drop_all()
+        db.metadata.drop_all(replica)
+    # Flask-SQLAlchemy keeps a (table-less) metadata per bind key, apps of other tests have no such bind
+    db.metadatas.pop("replica0", None)
+
+
+def replicate():
+    """Copy every row of the primary to the replica, as replication would"""
+    db.session.commit()
+    # Caught up, nobody needs to stick to the primary
+    current_app.extensions["replicas"]["sticky"] = MemoryStickyStore()
+    with db.engine.connect() as primary, db.engines["replica0"].begin() as replica:
+        for table in reversed(db.metadata.sorted_tables):
+            replica.execute(table.delete())
+        for table in db.metadata.sorted_tables:
+            rows = [row._asdict() for row in primary.execute(table.select())]
+            if rows:
+                replica.execute(table.insert(), rows)
+
+
+def change_primary_note(ticket_id, note):
+    db.session.get(Ticket, ticket_id).note = note
+    db.session.commit()
+    # Requests share this session in tests, loaded rows would hide where reads go
+    db.session.expunge_all()
+
+
+def test_reads_served_by_replica(client, init_database):
+    admin = get_header("testadmin1", "12345", client)
+    replicate()
+    change_primary_note(1, "Not replicated yet")
+
+    response = client.get('/tickets/1', headers=admin)
+    assert response.status_code == 200
+    assert response.json["note"] == "Ticket 1"
+    assert "Ticket 1" in [t["note"] for t in client.get('/tickets', headers=admin).json["tickets"]]
+    assert client.get('/profile', headers=admin).json["username"] == "testadmin1"
+    # Writes and undecorated reads use the primary
+    assert client.get('/tickets/search?q=replicated', headers=admin).json["tickets"][0]["id"] == 1
+
+
+def test_read_your_writes(app, client, init_database):
+    app.config["REPLICA_STICKY_SECONDS"] = 0.5
+    admin = get_header("testadmin1", "12345", client)
+    manager = get_header("testuser2", "54321", client)
+    replicate()
+
+    response = client.put('/tickets/3', headers=admin,
+                          json={"note": "Updated", "status": "Closed", "group": "Customer2", "user_id": ""})
+    assert response.status_code == 200
+    db.session.expunge_all()
+
+    # The author reads from the primary, other users from the lagging replica
+    assert client.get('/tickets/3', headers=admin).json["note"] == "Updated"
+    db.session.expunge_all()
+    assert client.get('/tickets/3', headers=manager).json["note"] == "Ticket 2"
+    db.session.expunge_all()
+
+    time.sleep(0.6)
+    assert client.get('/tickets/3', headers=admin).json["note"] == "Ticket 2"
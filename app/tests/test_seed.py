@@ -0,0 +1,34 @@
+import random
+
+from sqlalchemy import func, select
+
+from app import db
+from app.models import Group, Ticket, User
+from app.search import search_tickets
+from app.seed import seed_bulk
+from . import app  # noqa
+
+
+def test_seed_bulk(app):
+    seed_bulk(groups=10, users=50, tickets=2000, rng=random.Random(1), log=lambda message: None)
+
+    assert db.session.scalar(select(func.count(Group.id))) == 10
+    assert db.session.scalar(select(func.count(User.id))) == 50
+    assert db.session.scalar(select(func.count(Ticket.id))) == 2000
+    per_group = db.session.execute(
+        select(func.count(Ticket.id)).group_by(Ticket.group_id).order_by(func.count(Ticket.id).desc())
+    ).scalars().all()
+    assert per_group[0] > 3 * per_group[-1]  # skewed, not uniform
+    unassigned = db.session.scalar(select(func.count(Ticket.id)).where(Ticket.user_id.is_(None)))
+    assert 200 < unassigned < 800
+
+    # Assignees belong to the ticket's group
+    ticket = Ticket.query.filter(Ticket.user_id.isnot(None)).first()
+    assert ticket.group in ticket.user.groups
+
+    # The full-text index covers the bulk loaded rows and keeps following later writes
+    assert search_tickets(Ticket.query, ["printer"]).count() > 0
+    db.session.add(Ticket(note="zyxwv", status_id=1, group_id=1))
+    db.session.commit()
+    assert search_tickets(Ticket.query, ["zyxwv"]).count() == 1
+
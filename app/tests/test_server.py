@@ -0,0 +1,12 @@
+from app.server import server_options
+from . import app  # noqa
+
+
+def test_server_options_from_config(app):
+    app.config.update(SERVER_WORKERS=3, SERVER_THREADS=2, SERVER_PORT=8000)
+    options = server_options(app, threads=8, bind=None)
+    assert options["workers"] == 3
+    assert options["threads"] == 8
+    assert options["bind"].endswith(":8000")
+    assert options["preload_app"] is True
+    assert options["max_requests"] > 0 and options["max_requests_jitter"] > 0
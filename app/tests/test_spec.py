@@ -0,0 +1,46 @@
+import json
+
+from app import spec
+from . import app, client  # noqa
+
+
+def test_spec_built_once(client, monkeypatch):
+    calls = []
+    build = spec.build_spec
+    monkeypatch.setattr(spec, "build_spec", lambda app: calls.append(1) or build(app))
+
+    response = client.get('/spec')
+    assert response.status_code == 200
+    assert response.json["info"]["title"] == "My API"
+    assert "/tickets/{ticket_id}" in response.json["paths"]
+    assert "public" in response.headers["Cache-Control"]
+    etag = response.headers["ETag"]
+
+    assert client.get('/spec').data == response.data
+    response = client.get('/spec', headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert len(calls) == 1
+
+
+def test_spec_file(app, tmp_path, monkeypatch):
+    path = tmp_path / "spec.json"
+    swag = spec.build_spec(app)
+    swag["info"]["title"] = "Prebuilt"
+    path.write_text(json.dumps(swag))
+    app.config["SWAGGER_SPEC_FILE"] = str(path)
+    monkeypatch.setattr(spec, "build_spec", None)
+
+    response = app.test_client().get('/spec')
+    assert response.json["info"]["title"] == "Prebuilt"
+
+
+def test_stale_spec_file(app, tmp_path):
+    path = tmp_path / "spec.json"
+    swag = spec.build_spec(app)
+    swag["info"]["title"] = "Prebuilt"
+    swag[spec.FINGERPRINT_KEY] = "routes changed since"
+    path.write_text(json.dumps(swag))
+    app.config["SWAGGER_SPEC_FILE"] = str(path)
+
+    response = app.test_client().get('/spec')
+    assert response.json["info"]["title"] == "My API"
@@ -1,6 +1,14 @@
-from app.models import Ticket, Status, Group
+import csv
+import io
+import json
+
+from sqlalchemy import text
+
+from app.cache import Principal
+from app.models import Ticket, Status, Group, User, Role
+from app.utils import visible_tickets, ticket_query, encode_cursor
 from . import app, client, init_database, db  # noqa
-from . import get_header
+from . import get_header, count_queries, add_tickets
 
 
 def test_ticket_list_admin(client, init_database):
@@ -9,7 +17,8 @@ def test_ticket_list_admin(client, init_database):
     response = client.get('/tickets', headers=header)
 
     assert response.status_code == 200
-    assert len(response.json) == 3
+    assert len(response.json["tickets"]) == 3
+    assert response.json["next_cursor"] is None
 
 
 def test_ticket_list_analyst(client, init_database):
@@ -18,7 +27,74 @@ def test_ticket_list_analyst(client, init_database):
     response = client.get('/tickets', headers=header)
 
     assert response.status_code == 200
-    assert len(response.json) == 2
+    assert len(response.json["tickets"]) == 2
+
+
+def test_ticket_list_pagination(client, init_database):
+    header = get_header("testadmin1", "12345", client)
+    response = client.get('/tickets?limit=2', headers=header)
+    assert response.status_code == 200
+    assert [t["id"] for t in response.json["tickets"]] == [1, 2]
+    cursor = response.json["next_cursor"]
+    assert cursor
+
+    response = client.get(f'/tickets?limit=2&cursor={cursor}', headers=header)
+    assert response.status_code == 200
+    assert [t["id"] for t in response.json["tickets"]] == [3]
+    assert response.json["next_cursor"] is None
+
+
+def test_ticket_list_pagination_bad_args(client, init_database):
+    header = get_header("testadmin1", "12345", client)
+    response = client.get('/tickets?limit=0', headers=header)
+    assert response.status_code == 400
+    assert "limit" in response.json["message"]
+
+    response = client.get('/tickets?cursor=garbage', headers=header)
+    assert response.status_code == 400
+    assert "cursor" in response.json["message"]
+
+    # Bools and values out of BIGINT range are no keys either
+    for values in ([True], [2 ** 63], [-2 ** 63 - 1]):
+        response = client.get(f'/tickets?cursor={encode_cursor(values)}', headers=header)
+        assert response.status_code == 400
+        assert "cursor" in response.json["message"]
+
+
+def test_ticket_list_max_page_size(app, client, init_database):
+    app.config["TICKETS_MAX_PAGE_SIZE"] = 1
+    header = get_header("testadmin1", "12345", client)
+    response = client.get('/tickets?limit=100', headers=header)
+    assert response.status_code == 200
+    assert len(response.json["tickets"]) == 1
+    assert response.json["next_cursor"]
+
+
+def test_ticket_list_query_count_is_constant(client, init_database):
+    header = get_header("testuser3", "51423", client)
+    client.get('/tickets', headers=header)
+    with count_queries() as small:
+        response = client.get('/tickets', headers=header)
+    assert response.status_code == 200
+
+    add_tickets(30)
+    with count_queries() as large:
+        response = client.get('/tickets', headers=header)
+    assert response.status_code == 200
+    assert len(response.json["tickets"]) > 20
+    assert len(large) == len(small)
+
+
+def test_ticket_detail_query_count(client, init_database):
+    ticket = Ticket.query.filter_by(note="Ticket 3").first()
+    header = get_header("testuser3", "51423", client)
+    client.get(f'/tickets/{ticket.id}', headers=header)
+    with count_queries() as statements:
+        response = client.get(f'/tickets/{ticket.id}', headers=header)
+    assert response.status_code == 200
+    assert response.json["user"]["username"] == "testuser3"
+    # Principal is cached, only the ticket with status/group/user joined
+    assert len(statements) == 1
 
 
 def test_ticket_detail_analyst(client, init_database):
@@ -115,3 +191,380 @@ def test_ticket_create_post(client, init_database):
                            })
     assert response.status_code == 400
     assert "message" in response.json
+
+
+def test_ticket_export_ndjson(client, init_database):
+    header = get_header("testuser3", "51423", client)
+    response = client.get('/tickets/export', headers=header)
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    # Same visibility as the list: own group plus tickets assigned to the user
+    assert sorted(r["note"] for r in rows) == ["Ticket 2", "Ticket 3"]
+    assert {"id", "note", "status", "group", "user_id", "username"} == set(rows[0])
+
+
+def test_ticket_export_csv(app, client, init_database):
+    app.config["TICKETS_EXPORT_CHUNK_SIZE"] = 2
+    add_tickets(5)
+    header = get_header("testadmin1", "12345", client)
+    response = client.get('/tickets/export?format=csv', headers=header)
+    assert response.status_code == 200
+    assert response.mimetype == "text/csv"
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows[0] == ["id", "note", "status", "group", "user_id", "username"]
+    assert len(rows) == 1 + 8
+
+
+def test_ticket_export_bad_format(client, init_database):
+    header = get_header("testadmin1", "12345", client)
+    response = client.get('/tickets/export?format=xml', headers=header)
+    assert response.status_code == 400
+
+
+def test_ticket_list_admin_check_is_exact(client, init_database):
+    # "Admin assistant" contains "Admin", it must not unlock every group
+    group = Group.query.filter_by(name="Customer1").first()
+    user = User(username="assistant", email="assistant@example.com",
+                roles=[Role(name="Admin assistant")], groups=[group])
+    user.set_password("777")
+    db.session.add(user)
+    db.session.commit()
+
+    header = get_header("assistant", "777", client)
+    response = client.get('/tickets', headers=header)
+    assert response.status_code == 200
+    assert [t["note"] for t in response.json["tickets"]] == ["Ticket 1"]
+
+
+def test_ticket_bulk_create(client, init_database):
+    header = get_header("testuser2", "54321", client)
+    user = User.query.filter_by(username="testuser3").first()
+    items = [
+        {"note": "Bulk 1", "status": "Pending", "group": "Customer2", "user_id": ""},
+        {"note": "Bulk 2", "status": "Closed", "group": "Customer2", "user_id": user.id},
+        {"note": "Bulk 3", "status": "Nope", "group": "Customer2", "user_id": ""},
+        {"note": "Bulk 4", "status": "Pending", "group": "Customer1", "user_id": ""},
+        {"note": "Bulk 5", "status": "Pending", "group": "Customer2", "user_id": 1024},
+        {"note": "Bulk 6", "status": "Pending"},
+    ]
+    response = client.post('/tickets/bulk', headers=header, json=items)
+    assert response.status_code == 207
+    assert response.json["created"] == 2
+    results = response.json["results"]
+    assert [r["index"] for r in results] == list(range(6))
+    assert db.session.get(Ticket, results[0]["id"]).note == "Bulk 1"
+    assert db.session.get(Ticket, results[1]["id"]).user_id == user.id
+    assert "status" in results[2]["errors"]
+    assert "group" in results[3]["errors"]
+    assert "user_id" in results[4]["errors"]
+    assert "key_error" in results[5]["errors"]
+
+    # Principal, statuses and groups now come from caches: one assignee check, then the INSERT
+    # (SQLite runs it row by row to keep RETURNING in order, Postgres batches it)
+    with count_queries() as statements:
+        response = client.post('/tickets/bulk', headers=header, json=items[:2] * 50)
+    assert response.status_code == 201
+    assert len([s for s in statements if not s.startswith("INSERT")]) == 1
+
+
+def test_ticket_bulk_create_rejects(client, init_database):
+    header = get_header("testuser2", "54321", client)
+    response = client.post('/tickets/bulk', headers=header, json={"note": "not a list"})
+    assert response.status_code == 400
+    response = client.post('/tickets/bulk', headers=header,
+                           json=[{"note": "x", "status": "Nope", "group": "Customer2", "user_id": ""}])
+    assert response.status_code == 400
+    assert response.json["created"] == 0
+
+    header = get_header("testuser3", "51423", client)
+    response = client.post('/tickets/bulk', headers=header, json=[])
+    assert response.status_code == 403
+
+
+def test_ticket_bulk_create_wrong_types(client, init_database):
+    header = get_header("testuser2", "54321", client)
+    items = [
+        {"note": "x", "status": ["Pending"], "group": "Customer2", "user_id": ""},
+        {"note": "x", "status": "Pending", "group": {"name": "Customer2"}, "user_id": ""},
+        {"note": {"a": 1}, "status": "Pending", "group": "Customer2", "user_id": ""},
+        {"note": "Fine", "status": "Pending", "group": "Customer2", "user_id": ""},
+    ]
+    response = client.post('/tickets/bulk', headers=header, json=items)
+    assert response.status_code == 207
+    assert response.json["created"] == 1
+    results = response.json["results"]
+    assert set(results[0]["errors"]) == {"status"}
+    assert set(results[1]["errors"]) == {"group"}
+    assert results[2]["errors"] == {"note": "Note must be a string"}
+    assert "id" in results[3]
+
+
+def test_ticket_bulk_update_by_ids(client, init_database):
+    header = get_header("testuser2", "54321", client)
+    t1 = Ticket.query.filter_by(note="Ticket 1").first()
+    t2 = Ticket.query.filter_by(note="Ticket 2").first()
+    # Ticket 1 is in Customer1, which the manager is not a member of
+    response = client.patch('/tickets/bulk', headers=header,
+                            json={"ids": [t1.id, t2.id], "changes": {"status": "Closed", "user_id": 3}})
+    assert response.status_code == 200
+    assert response.json["updated"] == 1
+    db.session.expire_all()
+    assert t2.status.name == "Closed" and t2.user_id == 3
+    assert t1.status.name == "Pending"
+
+
+def test_ticket_bulk_update_by_filter(client, init_database):
+    add_tickets(9)
+    header = get_header("testadmin1", "12345", client)
+    pending = Ticket.query.join(Status).filter(Status.name == "Pending").count()
+    with count_queries() as statements:
+        response = client.patch('/tickets/bulk', headers=header,
+                                json={"filter": {"status": "Pending"}, "changes": {"status": "Closed"}})
+    assert response.status_code == 200
+    assert response.json["updated"] == pending
+    assert len([s for s in statements if s.startswith("UPDATE")]) == 1
+    assert Ticket.query.join(Status).filter(Status.name == "Pending").count() == 0
+
+    response = client.patch('/tickets/bulk', headers=header,
+                            json={"filter": {"assignee": ""}, "changes": {"group": "Customer3"}})
+    assert response.status_code == 200
+    assert Ticket.query.filter(Ticket.user_id.is_(None), Ticket.group_id != 3).count() == 0
+
+
+def test_ticket_bulk_update_user_id_as_string(client, init_database):
+    header = get_header("testadmin1", "12345", client)
+    with count_queries() as statements:
+        response = client.patch('/tickets/bulk', headers=header,
+                                json={"filter": {"assignee": "3"}, "changes": {"user_id": "2"}})
+    assert response.status_code == 200
+    assert response.json["updated"] == 1
+    # Both assignees checked with one query
+    assert len([s for s in statements if s.startswith("SELECT user.id \nFROM user")]) == 1
+    assert Ticket.query.filter_by(note="Ticket 3").first().user_id == 2
+
+    response = client.patch('/tickets/bulk', headers=header, json={"ids": [1], "changes": {"user_id": "abc"}})
+    assert response.status_code == 400
+    assert "user_id" in response.json["message"]
+
+
+def test_ticket_bulk_update_rejects(client, init_database):
+    header = get_header("testuser2", "54321", client)
+    response = client.patch('/tickets/bulk', headers=header, json={"ids": [1], "changes": {}})
+    assert response.status_code == 400
+    response = client.patch('/tickets/bulk', headers=header, json={"changes": {"status": "Closed"}})
+    assert response.status_code == 400
+    response = client.patch('/tickets/bulk', headers=header,
+                            json={"filter": {"colour": "red"}, "changes": {"status": "Closed"}})
+    assert response.status_code == 400
+    response = client.patch('/tickets/bulk', headers=header,
+                            json={"ids": [1], "changes": {"status": "Nope", "user_id": 1024}})
+    assert response.status_code == 400
+    assert {"status", "user_id"} <= set(response.json["message"])
+
+
+def test_ticket_ids_out_of_range(client, init_database):
+    header = get_header("testadmin1", "12345", client)
+    huge = 2 ** 64
+    response = client.get(f'/tickets?assignee={huge}', headers=header)
+    assert response.status_code == 400
+    assert "assignee" in response.json["message"]
+
+    # JSON true is no id, although Python's True == 1
+    for body in ({"ids": [True], "changes": {"status": "Closed"}},
+                 {"ids": [huge], "changes": {"status": "Closed"}}):
+        response = client.patch('/tickets/bulk', headers=header, json=body)
+        assert response.status_code == 400
+        assert "ids" in response.json["message"]
+    for user_id in (True, huge, str(huge)):
+        response = client.patch('/tickets/bulk', headers=header, json={"ids": [1], "changes": {"user_id": user_id}})
+        assert response.status_code == 400
+        assert "user_id" in response.json["message"]
+        response = client.post('/tickets/bulk', headers=header,
+                               json=[{"note": "x", "status": "Pending", "group": "Customer2", "user_id": user_id}])
+        assert response.status_code == 400
+        assert response.json["results"][0]["errors"] == {"user_id": "User not found"}
+        response = client.post('/create-ticket', headers=header,
+                               json={"note": "x", "status": "Pending", "group": "Customer2", "user_id": user_id})
+        assert response.status_code == 400
+    assert Ticket.query.filter_by(note="x").count() == 0
+
+
+def test_ticket_list_query_uses_indexes(client, init_database):
+    user = Principal(3, ["Analyst"], [2])
+    query = visible_tickets(ticket_query(), user).order_by(Ticket.id).limit(51)
+    sql = str(query.statement.compile(db.engine, compile_kwargs={"literal_binds": True}))
+    plan = " | ".join(row[-1] for row in db.session.execute(text("EXPLAIN QUERY PLAN " + sql)))
+    assert "USING INDEX ix_ticket_group_id" in plan
+    assert "USING INDEX ix_ticket_user_id" in plan
+    assert "SCAN ticket" not in plan
+
+
+def test_ticket_list_filters(client, init_database):
+    add_tickets(12)
+    header = get_header("testadmin1", "12345", client)
+    status = Status.query.filter_by(name="Closed").first()
+    user = User.query.filter_by(username="testuser3").first()
+
+    response = client.get('/tickets?status=Closed', headers=header)
+    assert response.status_code == 200
+    assert {t["status"]["name"] for t in response.json["tickets"]} == {"Closed"}
+    assert len(response.json["tickets"]) == Ticket.query.filter_by(status_id=status.id).count()
+
+    response = client.get(f'/tickets?group=Customer3&assignee={user.id}', headers=header)
+    assert response.status_code == 200
+    assert response.json["tickets"]
+    assert all(t["group"]["name"] == "Customer3" and t["user"]["id"] == user.id for t in response.json["tickets"])
+
+    response = client.get('/tickets?unassigned=true', headers=header)
+    assert response.status_code == 200
+    assert len(response.json["tickets"]) == Ticket.query.filter(Ticket.user_id.is_(None)).count()
+
+    for query in ('status=Nope', 'group=Nope', 'assignee=me', 'unassigned=true&assignee=1', 'sort=note'):
+        assert client.get(f'/tickets?{query}', headers=header).status_code == 400, query
+
+
+def test_ticket_list_filters_keep_visibility(client, init_database):
+    header = get_header("testuser3", "51423", client)
+    response = client.get('/tickets?group=Customer1', headers=header)
+    assert response.status_code == 200
+    assert response.json["tickets"] == []
+
+
+def test_ticket_list_sort_pages(client, init_database):
+    add_tickets(12)
+    header = get_header("testadmin1", "12345", client)
+    expected = {
+        "id": [(t.id,) for t in Ticket.query.order_by(Ticket.id)],
+        "-id": [(t.id,) for t in Ticket.query.order_by(Ticket.id.desc())],
+        "status": [(t.status_id, t.id) for t in Ticket.query.order_by(Ticket.status_id, Ticket.id)],
+        "-status": [(t.status_id, t.id) for t in Ticket.query.order_by(Ticket.status_id.desc(), Ticket.id.desc())],
+    }
+    for sort, keys in expected.items():
+        seen, cursor = [], None
+        while True:
+            url = f'/tickets?sort={sort}&limit=4' + (f'&cursor={cursor}' if cursor else '')
+            response = client.get(url, headers=header)
+            assert response.status_code == 200
+            seen += [t["id"] for t in response.json["tickets"]]
+            cursor = response.json["next_cursor"]
+            if not cursor:
+                break
+        assert seen == [key[-1] for key in keys], sort
+
+    # A cursor of the id order does not fit the status order
+    cursor = client.get('/tickets?limit=1', headers=header).json["next_cursor"]
+    assert client.get(f'/tickets?sort=status&cursor={cursor}', headers=header).status_code == 400
+
+
+def test_ticket_search(client, init_database):
+    group = Group.query.filter_by(name="Customer2").first()
+    status = Status.query.filter_by(name="Pending").first()
+    for note in ("Printer on fire", "printer out of paper", "Paper jam in printer, printer broken", "Coffee"):
+        db.session.add(Ticket(note=note, status=status, group=group))
+    db.session.commit()
+    header = get_header("testuser2", "54321", client)
+
+    response = client.get('/tickets/search?q=printer', headers=header)
+    assert response.status_code == 200
+    notes = [t["note"] for t in response.json["tickets"]]
+    assert set(notes) == {"Printer on fire", "printer out of paper", "Paper jam in printer, printer broken"}
+    # Two hits in one note rank it first
+    assert notes[0] == "Paper jam in printer, printer broken"
+
+    response = client.get('/tickets/search?q=paper printer&limit=1', headers=header)
+    assert len(response.json["tickets"]) == 1
+    cursor = response.json["next_cursor"]
+    response = client.get(f'/tickets/search?q=paper printer&limit=1&cursor={cursor}', headers=header)
+    assert len(response.json["tickets"]) == 1
+    assert response.json["next_cursor"] is None
+
+    assert client.get('/tickets/search?q=*"', headers=header).status_code == 400
+    for offset in (-1, 10001):
+        response = client.get(f'/tickets/search?q=printer&cursor={encode_cursor([offset])}', headers=header)
+        assert response.status_code == 400
+        assert "cursor" in response.json["message"]
+
+
+def test_ticket_search_follows_updates_and_visibility(client, init_database):
+    header = get_header("testuser2", "54321", client)
+    ticket = Ticket.query.filter_by(note="Ticket 2").first()
+    response = client.put(f'/tickets/{ticket.id}', headers=header,
+                          json={"note": "Renamed entry", "status": "Closed", "group": "Customer2", "user_id": ""})
+    assert response.status_code == 200
+    assert client.get('/tickets/search?q=renamed', headers=header).json["tickets"][0]["id"] == ticket.id
+    assert client.get('/tickets/search?q=Ticket 2', headers=header).json["tickets"] == []
+
+    # Ticket 1 belongs to Customer1, not visible to the manager
+    assert client.get('/tickets/search?q=Ticket 1', headers=header).json["tickets"] == []
+
+    db.session.delete(ticket)
+    db.session.commit()
+    assert client.get('/tickets/search?q=renamed', headers=header).json["tickets"] == []
+
+
+def test_ticket_detail_etag(client, init_database):
+    ticket = Ticket.query.filter_by(note="Ticket 2").first()
+    header = get_header("testuser2", "54321", client)
+    response = client.get(f'/tickets/{ticket.id}', headers=header)
+    etag = response.headers["ETag"]
+
+    with count_queries() as statements:
+        response = client.get(f'/tickets/{ticket.id}', headers={**header, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert len(statements) == 1
+
+    response = client.put(f'/tickets/{ticket.id}', headers=header,
+                          json={"note": "Changed", "status": "Closed", "group": "Customer2", "user_id": ""})
+    assert response.status_code == 200
+    response = client.get(f'/tickets/{ticket.id}', headers={**header, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+    # No 304 shortcut around the permission check
+    other = Ticket.query.filter_by(note="Ticket 1").first()
+    response = client.get(f'/tickets/{other.id}', headers={**header, "If-None-Match": etag})
+    assert response.status_code == 403
+
+
+def test_ticket_list_etag(client, init_database):
+    header = get_header("testadmin1", "12345", client)
+    etag = client.get('/tickets', headers=header).headers["ETag"]
+    response = client.get('/tickets', headers={**header, "If-None-Match": etag})
+    assert response.status_code == 304
+
+    # Bulk updates bump versions as well
+    response = client.patch('/tickets/bulk', headers=header,
+                            json={"filter": {"status": "Pending"}, "changes": {"status": "Closed"}})
+    assert response.json["updated"] == 1
+    response = client.get('/tickets', headers={**header, "If-None-Match": etag})
+    assert response.status_code == 200
+    new_etag = response.headers["ETag"]
+
+    # Renaming an assignee changes tickets embedding them
+    user = User.query.filter_by(username="testuser3").first()
+    response = client.put(f'/users/{user.id}', headers=header, json={"username": "renamed"})
+    assert response.status_code == 200
+    assert client.get('/tickets', headers={**header, "If-None-Match": new_etag}).status_code == 200
+
+
+def test_ticket_list_etag_per_query(client, init_database):
+    header = get_header("testadmin1", "12345", client)
+    etag = client.get('/tickets', headers=header).headers["ETag"]
+    # Same rows, other order or filter: not the same representation
+    for query in ('sort=status', 'sort=-id', 'unassigned=false'):
+        response = client.get(f'/tickets?{query}', headers={**header, "If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+
+
+def test_ticket_delete_conflict(client, init_database):
+    header = get_header("testadmin1", "12345", client)
+    ticket_id = Ticket.query.filter_by(note="Ticket 1").first().id
+    with db.engine.begin() as connection:
+        connection.execute(Ticket.__table__.update().where(Ticket.id == ticket_id)
+                           .values(note="Changed meanwhile", version=Ticket.version + 1))
+    assert client.delete(f'/tickets/{ticket_id}', headers=header).status_code == 409
+    db.session.expunge_all()
+    assert db.session.get(Ticket, ticket_id).note == "Changed meanwhile"
@@ -1,4 +1,4 @@
-from app.models import User
+from app.models import User, Role
 from . import app, client, init_database, db  # noqa
 from . import get_header
 
@@ -61,3 +61,57 @@ def test_user_delete(client, init_database):
     response = client.delete(f'/users/{victim.id}', headers=header)
 
     assert response.status_code == 204
+
+
+def test_role_check_is_exact(client, init_database):
+    # "Sub-Manager" contains "Manager", it must not pass @role_required('Manager')
+    role = Role(name="Sub-Manager")
+    user = User(username="submanager", email="sub@example.com", roles=[role])
+    user.set_password("777")
+    db.session.add(user)
+    db.session.commit()
+
+    header = get_header("submanager", "777", client)
+    response = client.get('/users', headers=header)
+    assert response.status_code == 403
+
+
+def test_user_etags(client, init_database):
+    header = get_header("testadmin1", "12345", client)
+    user = User.query.filter_by(username="testuser3").first()
+    detail_etag = client.get(f'/users/{user.id}', headers=header).headers["ETag"]
+    list_etag = client.get('/users', headers=header).headers["ETag"]
+    assert client.get(f'/users/{user.id}', headers={**header, "If-None-Match": detail_etag}).status_code == 304
+    assert client.get('/users', headers={**header, "If-None-Match": list_etag}).status_code == 304
+
+    response = client.put(f'/users/{user.id}', headers=header, json={"roles": ["Manager"]})
+    assert response.status_code == 200
+    assert client.get(f'/users/{user.id}', headers={**header, "If-None-Match": detail_etag}).status_code == 200
+    assert client.get('/users', headers={**header, "If-None-Match": list_etag}).status_code == 200
+
+
+def bump_version_elsewhere(user):
+    """Concurrent write (e.g. the password rehash of a login) the session holding `user` doesn't see"""
+    with db.engine.begin() as connection:
+        connection.execute(User.__table__.update().where(User.id == user.id).values(version=User.version + 1))
+
+
+def test_user_put_conflict(client, init_database):
+    header = get_header("testadmin1", "12345", client)
+    user = User.query.filter_by(username="testuser3").first()
+    bump_version_elsewhere(user)
+    response = client.put(f'/users/{user.id}', headers=header, json={"username": "renamed"})
+    assert response.status_code == 409
+    db.session.expunge_all()
+    assert User.query.filter_by(username="testuser3").first() is not None
+
+
+def test_user_delete_conflict(client, init_database):
+    header = get_header("testadmin1", "12345", client)
+    user = User.query.filter_by(username="testuser3").first()
+    bump_version_elsewhere(user)
+    assert client.delete(f'/users/{user.id}', headers=header).status_code == 409
+    db.session.expunge_all()
+    user = User.query.filter_by(username="testuser3").first()
+    # Unassigning the user's tickets was rolled back as well
+    assert user is not None and len(user.tickets) == 1
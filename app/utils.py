@@ -1,33 +1,58 @@
+import base64
+import binascii
+import hashlib
+import json
+import operator
 import re
 from datetime import datetime, timedelta
 from functools import wraps
 
 import jwt
-from flask import request
+from flask import request, current_app, Response
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import joinedload, selectinload
 
+from . import db
+from .cache import reference_cache, principal_cache, Principal
+from .compression import ENCODERS, encoded_etag
 from .config import Config
 from .models import User, Ticket, Status, Group
 
 
-def generate_token(user_id):
+def generate_token(user_id, claims=None):
     payload = {
         'exp': datetime.utcnow() + timedelta(days=1),
         'iat': datetime.utcnow(),
         'sub': user_id
     }
+    if claims:
+        payload.update(claims)
     return jwt.encode(payload, Config.JWT_SECRET_KEY, algorithm='HS256')
 
 
-def verify_token(token):
+def authz_claims(user):
+    """Token claims that let requests be authorized without loading the user"""
+    return {
+        'roles': [r.name for r in user.roles],
+        'groups': [g.id for g in user.groups],
+        'ver': user.authz_version,
+    }
+
+
+def decode_token(token):
     try:
-        payload = jwt.decode(token, Config.JWT_SECRET_KEY, algorithms=['HS256'])
-        return payload['sub']
+        return jwt.decode(token, Config.JWT_SECRET_KEY, algorithms=['HS256'])
     except jwt.ExpiredSignatureError:
         return None
     except jwt.InvalidTokenError:
         return None
 
 
+def verify_token(token):
+    payload = decode_token(token)
+    return payload['sub'] if payload else None
+
+
 def login_required(f):
     @wraps(f)
     def wrap(*args, **kwargs):
@@ -35,13 +60,23 @@ def login_required(f):
         if not token:
             return {'message': 'Token is missing'}, 401
 
-        user_id = verify_token(token)
-        if not user_id:
+        payload = decode_token(token)
+        if not payload or not payload.get('sub'):
             return {'message': 'Invalid token'}, 401
+        user_id = payload['sub']
 
-        user = get_user_by_id(user_id)
-        if not user:
-            return {'message': 'User not found'}, 404
+        # Principal (id, role names, group ids), not a User row
+        if 'ver' in payload:
+            version = principal_cache.authz_version(user_id)
+            if version is None:
+                return {'message': 'User not found'}, 404
+            if version != payload['ver']:
+                return {'message': 'Token is outdated, log in again'}, 401
+            user = Principal(user_id, payload.get('roles', ()), payload.get('groups', ()))
+        else:
+            user = principal_cache.get(user_id)
+            if not user:
+                return {'message': 'User not found'}, 404
         kwargs['user'] = user
         return f(*args, **kwargs)
 
@@ -55,7 +90,7 @@ def role_required(role):
             user = kwargs['user']
             if not user:
                 return {'message': 'Internal server error: User not found'}, 500
-            if role not in str(user.roles):
+            if not user.has_role(role):
                 return {'message': 'Forbidden.'}, 403
             return f(*args, **kwargs)
 
@@ -68,14 +103,178 @@ def get_user_by_id(user_id):
     return User.query.filter_by(id=user_id).first()
 
 
+def get_user_with_relations(user_id):
+    """User with roles and groups loaded up front, for dumping with UserSchema"""
+    return User.query.options(
+        selectinload(User.roles), selectinload(User.groups)
+    ).filter_by(id=user_id).first()
+
+
 def validate_email(email):
     pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
     print(re.match(pattern, email))
     return re.match(pattern, email)
 
 
+def ticket_load_options():
+    """Loader options fetching everything TicketSchema dumps in the same SELECT (no N+1)"""
+    return (
+        joinedload(Ticket.status),
+        joinedload(Ticket.group),
+        joinedload(Ticket.user),
+    )
+
+
+def ticket_query():
+    return Ticket.query.options(*ticket_load_options())
+
+
+def own_tickets(user):
+    """Clause matching tickets of the user's groups or assigned to the user"""
+    return or_(
+        Ticket.group_id.in_(user.group_ids),
+        Ticket.user_id == user.id
+    )
+
+
+def visible_tickets(query, user):
+    """Restrict a ticket query (ORM or select()) to the tickets the user is allowed to see"""
+    if user.is_admin:
+        return query
+    return query.filter(own_tickets(user))
+
+
 def get_ticket_by_id(ticket_id):
-    return Ticket.query.filter_by(id=ticket_id).first()
+    return ticket_query().filter_by(id=ticket_id).first()
+
+
+def ticket_etag_key(ticket):
+    """Versions a dumped ticket depends on: its own and its assignee's (nested in the dump)"""
+    return ticket.id, ticket.version, ticket.user.version if ticket.user else None
+
+
+def make_etag(*parts):
+    """Strong ETag of a representation, from the row versions it is built from"""
+    return hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+
+
+def not_modified(etag):
+    """
+    304 response when If-None-Match of the request still matches etag, or the ETag of one of
+    its compressed variants, otherwise None
+    """
+    for candidate in (etag, *(encoded_etag(etag, encoding) for encoding in ENCODERS)):
+        if request.if_none_match.contains(candidate):
+            response = Response(status=304)
+            response.set_etag(candidate)
+            return response
+    return None
+
+
+# Range of the BIGINT keys, larger values overflow in the database driver
+MIN_ID, MAX_ID = -2 ** 63, 2 ** 63 - 1
+
+
+def is_id(value):
+    """An int (bools are ints too in Python, not in JSON) the database can compare keys with"""
+    return isinstance(value, int) and not isinstance(value, bool) and MIN_ID <= value <= MAX_ID
+
+
+def parse_id(value):
+    """Id from a JSON number or a string of digits (query args), None for anything is_id rejects"""
+    if isinstance(value, str) and re.fullmatch(r"\s*-?[0-9]+\s*", value):
+        value = int(value)
+    return value if is_id(value) else None
+
+
+def encode_cursor(values):
+    """Opaque pagination cursor: urlsafe base64 of the last row's sort key"""
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+def get_page_args(key_size=1):
+    """Read ?limit= and ?cursor= of a keyset-paginated list, limit is capped server-side"""
+    errors = {}
+    limit = current_app.config["TICKETS_PAGE_SIZE"]
+    if "limit" in request.args:
+        try:
+            limit = int(request.args["limit"])
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            errors["limit"] = "Limit must be a positive integer"
+    limit = min(limit, current_app.config["TICKETS_MAX_PAGE_SIZE"])
+
+    after = None
+    if "cursor" in request.args:
+        after = decode_cursor(request.args["cursor"])
+        if not after or len(after) != key_size or not all(is_id(v) for v in after):
+            errors["cursor"] = "Invalid cursor"
+    return errors, limit, after
+
+
+def keyset_after(columns, values, descending=False):
+    """
+    Rows following `values` in ORDER BY columns order, i.e. (a, b) > (x, y) spelled as
+    a > x OR (a = x AND b > y), which every backend can match against a composite index
+    """
+    compare = operator.lt if descending else operator.gt
+    clause = compare(columns[-1], values[-1])
+    for column, value in zip(reversed(columns[:-1]), reversed(values[:-1])):
+        clause = or_(compare(column, value), and_(column == value, clause))
+    return clause
+
+
+# ?sort= keys of the ticket list, the id tie-breaker keeps keyset pagination stable
+TICKET_SORTS = {
+    "id": (Ticket.id,),
+    "status": (Ticket.status_id, Ticket.id),
+}
+
+
+def get_ticket_list_args():
+    """
+    Read ?status=, ?group=, ?assignee=, ?unassigned= and ?sort= of the ticket list.
+    Returns errors, filter criteria, sort columns, descending
+    """
+    errors, criteria = {}, []
+    args = request.args
+    if "status" in args:
+        status_id = reference_cache.ids(Status, (args["status"],)).get(args["status"])
+        if status_id is None:
+            errors["status"] = "Wrong status provided"
+        criteria.append(Ticket.status_id == status_id)
+    if "group" in args:
+        group_id = reference_cache.ids(Group, (args["group"],)).get(args["group"])
+        if group_id is None:
+            errors["group"] = "Wrong group provided"
+        criteria.append(Ticket.group_id == group_id)
+    if "assignee" in args:
+        assignee = parse_id(args["assignee"])
+        if assignee is None:
+            errors["assignee"] = "Assignee must be a user id"
+        criteria.append(Ticket.user_id == assignee)
+    if args.get("unassigned", "").lower() in ("1", "true", "yes"):
+        if "assignee" in args:
+            errors["unassigned"] = "Cannot be combined with assignee"
+        criteria.append(Ticket.user_id.is_(None))
+
+    sort = args.get("sort", "id")
+    descending = sort.startswith("-")
+    columns = TICKET_SORTS.get(sort.lstrip("-"))
+    if columns is None:
+        errors["sort"] = f"Sort by one of: {', '.join(TICKET_SORTS)}, prefix with - for descending"
+        columns = TICKET_SORTS["id"]
+    return errors, criteria, columns, descending
 
 
 def validate_ticket(data, user):
@@ -96,18 +295,129 @@ def validate_ticket(data, user):
         # Status validation
         if status_name is None:
             errors["status"] = "No status provided"
-        status = Status.query.filter_by(name=status_name).first()
+        status = reference_cache.get(Status, status_name)
         if status is None:
             errors["status"] = "Wrong status provided"
 
         # Group validation
-        group = Group.query.filter_by(name=group_name).first()
+        group = reference_cache.get(Group, group_name)
         if group is None:
             errors["group"] = "Wrong group provided"
 
         # User validation
-        assign_to_user = User.query.filter_by(id=user_id).first()
+        assign_to_user = None
+        if user_id:
+            assignee = parse_id(user_id)
+            assign_to_user = get_user_by_id(assignee) if assignee is not None else None
         if user_id and assign_to_user is None:
             errors["user_id"] = "User not found"
 
         return errors, note, status, group, assign_to_user
+
+
+def validate_tickets(items, user):
+    """
+    Set based validate_ticket for many payloads: statuses and groups come from the reference
+    cache and all assignees are checked with one query. Returns (errors, row) per item, row is
+    a dict of Ticket column values ready for a bulk INSERT.
+    """
+    payloads = [data for data in items if isinstance(data, dict)]
+    # Only names can be looked up, anything else (lists, dicts, numbers) is a wrong status/group below
+    status_ids = reference_cache.ids(Status, {data.get("status") for data in payloads
+                                              if isinstance(data.get("status"), str)})
+    group_ids = reference_cache.ids(Group, {data.get("group") for data in payloads
+                                            if isinstance(data.get("group"), str)})
+
+    parsed = []
+    for data in items:
+        if not isinstance(data, dict):
+            parsed.append(({"key_error": "Missing required parameters"}, None))
+            continue
+        try:
+            note = data["note"]
+            status_name = data["status"]
+            group_name = data["group"]
+            user_id = data["user_id"]
+        except KeyError:
+            parsed.append(({"key_error": "Missing required parameters"}, None))
+            continue
+        if user_id in ("", None):
+            user_id = None
+        elif parse_id(user_id) is None:
+            user_id = -1  # not an id, no such user
+        else:
+            user_id = parse_id(user_id)
+        parsed.append(({}, {"note": note, "status": status_name, "group": group_name, "user_id": user_id}))
+
+    assignees = {row["user_id"] for _, row in parsed if row and row["user_id"] is not None}
+    existing = set(db.session.scalars(select(User.id).where(User.id.in_(assignees)))) if assignees else set()
+
+    results = []
+    for errors, row in parsed:
+        if row is None:
+            results.append((errors, None))
+            continue
+        if row["note"] is None:
+            errors["note"] = "No note"
+        elif not isinstance(row["note"], str):
+            errors["note"] = "Note must be a string"
+        status_id = status_ids.get(row["status"]) if isinstance(row["status"], str) else None
+        if status_id is None:
+            errors["status"] = "Wrong status provided"
+        group_id = group_ids.get(row["group"]) if isinstance(row["group"], str) else None
+        if group_id is None:
+            errors["group"] = "Wrong group provided"
+        elif group_id not in user.group_ids and not user.is_admin:
+            errors["group"] = "You are not allowed to create tickets for other groups"
+        if row["user_id"] is not None and row["user_id"] not in existing:
+            errors["user_id"] = "User not found"
+        if errors:
+            results.append((errors, None))
+        else:
+            results.append(({}, {
+                "note": row["note"], "status_id": status_id, "group_id": group_id, "user_id": row["user_id"]
+            }))
+    return results
+
+
+def validate_ticket_changes(*change_sets):
+    """
+    Partial ticket changes (status, group, user_id) as Ticket column values for a bulk UPDATE,
+    the assignees of all change sets are checked with one query. Returns (errors, values) per set
+    """
+    results, assignees = [], {}
+    for changes in change_sets:
+        errors, values = {}, {}
+        results.append((errors, values))
+        if not isinstance(changes, dict) or not changes.keys() & {"status", "group", "user_id"}:
+            errors["changes"] = "Nothing to change, expected status, group and/or user_id"
+            continue
+
+        if "status" in changes:
+            values["status_id"] = reference_cache.ids(Status, (changes["status"],)).get(changes["status"]) \
+                if isinstance(changes["status"], str) else None
+            if values["status_id"] is None:
+                errors["status"] = "Wrong status provided"
+        if "group" in changes:
+            values["group_id"] = reference_cache.ids(Group, (changes["group"],)).get(changes["group"]) \
+                if isinstance(changes["group"], str) else None
+            if values["group_id"] is None:
+                errors["group"] = "Wrong group provided"
+        if "user_id" in changes:
+            user_id = changes["user_id"]
+            if user_id in ("", None):
+                values["user_id"] = None
+            elif parse_id(user_id) is None:
+                errors["user_id"] = "User not found"
+            else:
+                assignees[len(results) - 1] = parse_id(user_id)
+
+    ids = set(assignees.values())
+    existing = set(db.session.scalars(select(User.id).where(User.id.in_(ids)))) if ids else set()
+    for index, user_id in assignees.items():
+        errors, values = results[index]
+        if user_id in existing:
+            values["user_id"] = user_id
+        else:
+            errors["user_id"] = "User not found"
+    return results
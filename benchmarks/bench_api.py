@@ -0,0 +1,141 @@
+"""Latency and throughput of the API endpoints over seeded datasets, written as JSON"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from app import create_app, db
+from .dataset import ADMIN, MANAGER, seed
+
+
+class BenchConfig:
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Measure the endpoints, not the login throttling
+    RATELIMIT_ENABLED = False
+
+
+def scenarios(client, shape, rng):
+    """name -> callable issuing one request, the dataset's ids are 1..n (fresh tables)"""
+    def credentials(user):
+        return {"username": user[0], "password": user[1]}
+
+    admin = {"Authorization": client.post('/login', json=credentials(ADMIN)).json["token"]}
+    manager = {"Authorization": client.post('/login', json=credentials(MANAGER)).json["token"]}
+    ticket = {"note": "Benchmark", "status": "Pending", "group": "Group1", "user_id": ""}
+    return {
+        "login": lambda: client.post('/login', json=credentials(MANAGER)),
+        "profile": lambda: client.get('/profile', headers=manager),
+        "tickets": lambda: client.get('/tickets', headers=admin),
+        "tickets_manager": lambda: client.get('/tickets', headers=manager),
+        "ticket_detail": lambda: client.get(f'/tickets/{rng.randint(1, shape["tickets"])}', headers=admin),
+        "create_ticket": lambda: client.post('/create-ticket', headers=admin, json=ticket),
+        "users": lambda: client.get('/users', headers=admin),
+        "user_detail": lambda: client.get(f'/users/{rng.randint(1, shape["users"])}', headers=admin),
+    }
+
+
+def measure(call, requests, warmup):
+    for _ in range(warmup):
+        call()
+    latencies, statuses = [], {}
+    started = time.perf_counter()
+    for _ in range(requests):
+        t = time.perf_counter()
+        response = call()
+        response.get_data()
+        latencies.append(time.perf_counter() - t)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+    total = time.perf_counter() - started
+    latencies.sort()
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000
+
+    return {
+        "requests": requests,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "p50_ms": percentile(50),
+        "p90_ms": percentile(90),
+        "p99_ms": percentile(99),
+        "max_ms": latencies[-1] * 1000,
+        "throughput_rps": requests / total,
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+    }
+
+
+def run(database, size, requests, warmup, only=None):
+    config = type("Config", (BenchConfig,), {"SQLALCHEMY_DATABASE_URI": database})
+    app = create_app(config)
+    results = []
+    with app.app_context():
+        started = time.perf_counter()
+        shape = seed(size)
+        seed_seconds = time.perf_counter() - started
+        client = app.test_client()
+        rng = random.Random(1)
+        for name, call in scenarios(client, shape, rng).items():
+            if only and name not in only:
+                continue
+            result = measure(call, requests, warmup)
+            result.update(scenario=name, dialect=db.engine.dialect.name, **shape)
+            results.append(result)
+            print(f'{db.engine.dialect.name:>10} {size:>8} {name:<16} p50 {result["p50_ms"]:8.2f} ms  '
+                  f'p99 {result["p99_ms"]:8.2f} ms  {result["throughput_rps"]:8.1f} req/s', file=sys.stderr)
+        print(f'seeded {size} tickets in {seed_seconds:.1f}s', file=sys.stderr)
+        db.session.remove()
+        db.drop_all()
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000], help="Ticket counts, e.g. 1000 100000 1000000")
+    parser.add_argument("--database", action="append",
+                        help="SQLAlchemy URI, repeatable (default: a temporary SQLite file). Tables are dropped!")
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--scenario", action="append", help="Only these scenarios, repeatable")
+    parser.add_argument("--output", "-o", help="JSON results file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        databases = args.database or [f"sqlite:///{os.path.join(tmp, 'bench.db')}"]
+        results = [
+            result
+            for database in databases
+            for size in args.sizes
+            for result in run(database, size, args.requests, args.warmup, args.scenario)
+        ]
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "created": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    body = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(body)
+    else:
+        print(body)
+
+
+if __name__ == "__main__":
+    main()
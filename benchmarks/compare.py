@@ -0,0 +1,38 @@
+"""Compare two bench_api JSON reports, scenario by scenario"""
+import argparse
+import json
+import sys
+
+
+def key(result):
+    return result["dialect"], result["tickets"], result["scenario"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--metric", default="p50_ms", help="Result field to compare (default: p50_ms)")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Relative slowdown reported as a regression (default: 0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    with open(args.before) as f:
+        before = {key(r): r for r in json.load(f)["results"]}
+    with open(args.after) as f:
+        after = {key(r): r for r in json.load(f)["results"]}
+
+    regressions = 0
+    for k in sorted(before.keys() & after.keys()):
+        old, new = before[k][args.metric], after[k][args.metric]
+        change = (new - old) / old if old else 0.0
+        # Higher throughput is better, higher latency is worse
+        worse = -change if args.metric == "throughput_rps" else change
+        flag = "REGRESSION" if worse > args.threshold else ""
+        regressions += bool(flag)
+        print(f"{k[0]:>10} {k[1]:>8} {k[2]:<16} {old:10.2f} -> {new:10.2f}  {change:+7.1%}  {flag}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
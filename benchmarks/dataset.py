@@ -0,0 +1,43 @@
+import random
+
+from sqlalchemy import insert, select
+
+from app import db
+from app.models import User, Role, Group, user_roles, user_groups
+from app.seed import seed_bulk
+
+ADMIN = ("bench_admin", "bench-admin-password")
+MANAGER = ("bench_manager", "bench-manager-password")
+
+
+def dataset_shape(tickets):
+    """Users and groups growing with the ticket count: 1k -> 10 users/5 groups, 1M -> 10k users/500 groups"""
+    return {"tickets": tickets, "users": max(10, tickets // 100), "groups": max(5, tickets // 2000)}
+
+
+def seed(tickets, rng=None):
+    """
+    Fresh schema with `tickets` tickets (ids 1..n), see app.seed.seed_bulk for the distribution.
+    Users 1 and 2 are ADMIN (all roles and groups) and MANAGER. Needs an app context.
+    """
+    rng = rng or random.Random(0)
+    shape = dataset_shape(tickets)
+    db.drop_all()
+    db.create_all()
+
+    for username, password in (ADMIN, MANAGER):
+        user = User(username=username, email=f"{username}@bench.local")
+        user.set_password(password)
+        db.session.add(user)
+    db.session.commit()
+    seed_bulk(shape["groups"], shape["users"] - 2, tickets, rng=rng, log=lambda message: None)
+
+    admin_id, manager_id = db.session.scalars(select(User.id).order_by(User.id).limit(2)).all()
+    roles = dict(db.session.execute(select(Role.name, Role.id)).all())
+    group_ids = db.session.scalars(select(Group.id)).all()
+    db.session.execute(insert(user_roles), [{"user_id": admin_id, "role_id": role_id} for role_id in roles.values()]
+                       + [{"user_id": manager_id, "role_id": roles["Manager"]}])
+    db.session.execute(insert(user_groups), [{"user_id": admin_id, "group_id": group_id} for group_id in group_ids]
+                       + [{"user_id": manager_id, "group_id": group_id} for group_id in group_ids[:3]])
+    db.session.commit()
+    return shape
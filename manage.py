@@ -1,5 +1,7 @@
+import json
+
+import click
 from flask.cli import FlaskGroup
-from werkzeug.security import generate_password_hash
 
 from app import db
 from app.models import User, Role, Status, Group
@@ -22,10 +24,10 @@ def create_superuser():
     superuser = User(
         username=username,
         email=email,
-        password=generate_password_hash(password),
         roles=Role.query.all(),
         groups=Group.query.all()
     )
+    superuser.set_password(password)
 
     db.session.add(superuser)
     db.session.commit()
@@ -75,5 +77,78 @@ def seed_statuses_roles():
         db.session.commit()
 
 
+@cli.command("seed-bulk")
+@click.option("--groups", default=100, show_default=True)
+@click.option("--users", default=1000, show_default=True)
+@click.option("--tickets", default=100000, show_default=True)
+@click.option("--skew", default=1.0, show_default=True, help="Zipf exponent of group/user sizes, 0 for uniform")
+@click.option("--groups-per-user", default=3, show_default=True)
+@click.option("--password", default="password", show_default=True, help="Password of all generated users")
+@click.option("--seed", "random_seed", default=0, show_default=True)
+def seed_bulk(groups, users, tickets, skew, groups_per_user, password, random_seed):
+    """Append a large synthetic dataset (groups, users, memberships, tickets) for load testing"""
+    import random
+    import time
+
+    from app.seed import seed_bulk
+
+    started = time.perf_counter()
+    seed_bulk(groups, users, tickets, skew, groups_per_user, password, random.Random(random_seed))
+    print(f'Seeded in {time.perf_counter() - started:.1f}s')
+
+
+@cli.command("loadtest")
+@click.option("--url", default="http://127.0.0.1:5000", show_default=True, help="Server to load")
+@click.option("--serve", is_flag=True, help="Start 'manage.py serve' on the --url port for the test")
+@click.option("--users", default=20, show_default=True, help="Concurrent synthetic users (threads)")
+@click.option("--username-pattern", default="user{}", show_default=True)
+@click.option("--first-id", default=1, show_default=True, help="First number filled into the pattern")
+@click.option("--password", default="password", show_default=True)
+@click.option("--mix", default="list=50,detail=30,create=10,update=10", show_default=True)
+@click.option("--rate", default=0.0, show_default=True, help="Target requests per second in total, 0: unpaced")
+@click.option("--duration", default=30.0, show_default=True, help="Seconds")
+@click.option("--output", "-o", help="Also write the report as JSON")
+def loadtest(url, serve, users, username_pattern, first_id, password, mix, rate, duration, output):
+    """Drive concurrent mixed ticket traffic over keep-alive connections, report latency per endpoint"""
+    from urllib.parse import urlsplit
+
+    from app.loadtest import LoadTest, format_report, start_server
+
+    server = start_server(urlsplit(url).netloc) if serve else None
+    try:
+        test = LoadTest(url, users, password, mix, rate, duration, username_pattern, first_id)
+        report = test.run()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    print(format_report(report))
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+@cli.command("spec")
+@click.option("--output", "-o", default="spec.json", show_default=True)
+def build_spec_file(output):
+    """Write the OpenAPI spec to a static file, served instead of introspecting (SWAGGER_SPEC_FILE)"""
+    from app.spec import build_spec
+
+    with open(output, "w") as f:
+        json.dump(build_spec(app), f, sort_keys=True)
+    print(f'Spec written to {output}')
+
+
+@cli.command("serve")
+@click.option("--bind", "-b", help="host:port, defaults to SERVER_HOST:SERVER_PORT")
+@click.option("--workers", "-w", type=int, help="Worker processes, defaults to SERVER_WORKERS")
+@click.option("--threads", "-t", type=int, help="Threads per worker, defaults to SERVER_THREADS")
+def serve(bind, workers, threads):
+    """Run the app under gunicorn (pre-forked workers, preloaded app, recycled workers)"""
+    from app.server import serve
+
+    serve(app, bind=bind, workers=workers, threads=threads)
+
+
 if __name__ == "__main__":
     cli()
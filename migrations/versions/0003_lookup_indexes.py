@@ -0,0 +1,58 @@
+"""Index ticket foreign keys, primary keys for association tables
+
+Revision ID: 0003_lookup_indexes
+Revises: 0002_user_authz_version
+Create Date: 2026-10-18 11:27:15.101131
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003_lookup_indexes'
+down_revision = '0002_user_authz_version'
+branch_labels = None
+depends_on = None
+
+ASSOCIATIONS = (('user_roles', 'role_id'), ('user_groups', 'group_id'))
+
+
+def _deduplicate(table, column):
+    """Drop incomplete and repeated rows, they would violate the new primary key"""
+    op.execute(f'DELETE FROM {table} WHERE user_id IS NULL OR {column} IS NULL')
+    if op.get_context().dialect.name == 'postgresql':
+        op.execute(f'DELETE FROM {table} a USING {table} b '
+                   f'WHERE a.ctid < b.ctid AND a.user_id = b.user_id AND a.{column} = b.{column}')
+    else:
+        op.execute(f'DELETE FROM {table} WHERE rowid NOT IN '
+                   f'(SELECT min(rowid) FROM {table} GROUP BY user_id, {column})')
+
+
+def upgrade():
+    with op.batch_alter_table('ticket', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_ticket_group_id'), ['group_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_ticket_status_id'), ['status_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_ticket_user_id'), ['user_id'], unique=False)
+
+    for table, column in ASSOCIATIONS:
+        _deduplicate(table, column)
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column('user_id', existing_type=sa.INTEGER(), nullable=False)
+            batch_op.alter_column(column, existing_type=sa.INTEGER(), nullable=False)
+            batch_op.create_primary_key(f'{table}_pkey', ['user_id', column])
+            batch_op.create_index(batch_op.f(f'ix_{table}_{column}'), [column], unique=False)
+
+
+def downgrade():
+    for table, column in reversed(ASSOCIATIONS):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_index(batch_op.f(f'ix_{table}_{column}'))
+            batch_op.drop_constraint(f'{table}_pkey', type_='primary')
+            batch_op.alter_column(column, existing_type=sa.INTEGER(), nullable=True)
+            batch_op.alter_column('user_id', existing_type=sa.INTEGER(), nullable=True)
+
+    with op.batch_alter_table('ticket', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_ticket_user_id'))
+        batch_op.drop_index(batch_op.f('ix_ticket_status_id'))
+        batch_op.drop_index(batch_op.f('ix_ticket_group_id'))
@@ -0,0 +1,48 @@
+"""Full-text index over ticket notes
+
+SQLite triggers are dropped when a batch migration recreates the ticket table,
+such migrations have to create them again (see app/search.py).
+
+Revision ID: 0005_ticket_note_search
+Revises: 0004_ticket_status_sort_index
+Create Date: 2026-10-18 11:31:40.204517
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0005_ticket_note_search'
+down_revision = '0004_ticket_status_sort_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_context().dialect.name
+    if dialect == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE ticket_fts USING fts5(note, content='ticket', content_rowid='id')")
+        op.execute("CREATE TRIGGER ticket_fts_insert AFTER INSERT ON ticket BEGIN "
+                   "INSERT INTO ticket_fts(rowid, note) VALUES (new.id, new.note); END")
+        op.execute("CREATE TRIGGER ticket_fts_delete AFTER DELETE ON ticket BEGIN "
+                   "INSERT INTO ticket_fts(ticket_fts, rowid, note) VALUES ('delete', old.id, old.note); END")
+        op.execute("CREATE TRIGGER ticket_fts_update AFTER UPDATE OF note ON ticket BEGIN "
+                   "INSERT INTO ticket_fts(ticket_fts, rowid, note) VALUES ('delete', old.id, old.note); "
+                   "INSERT INTO ticket_fts(rowid, note) VALUES (new.id, new.note); END")
+        # Index the notes already in the table
+        op.execute("INSERT INTO ticket_fts(ticket_fts) VALUES ('rebuild')")
+    elif dialect == 'postgresql':
+        op.execute("ALTER TABLE ticket ADD COLUMN note_tsv tsvector "
+                   "GENERATED ALWAYS AS (to_tsvector('english', coalesce(note, ''))) STORED")
+        op.execute("CREATE INDEX ix_ticket_note_tsv ON ticket USING GIN (note_tsv)")
+
+
+def downgrade():
+    dialect = op.get_context().dialect.name
+    if dialect == 'sqlite':
+        for trigger in ('ticket_fts_insert', 'ticket_fts_delete', 'ticket_fts_update'):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS ticket_fts")
+    elif dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_ticket_note_tsv")
+        op.execute("ALTER TABLE ticket DROP COLUMN IF EXISTS note_tsv")